@@ -0,0 +1,261 @@
+"""
+Times and memory-profiles every stage of the experiment pipeline on synthetic data and the local Aer simulator, and
+writes the measurements as JSON so runs on different commits can be compared.
+
+    python -m benchmarks.run_benchmarks --output bench.json
+    python -m benchmarks.run_benchmarks --compare old.json new.json
+"""
+import argparse
+import itertools
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, List
+
+import numpy as np
+from qiskit.providers.aer import QasmSimulator
+
+from benchmarks.synthetic import SyntheticResult, synthetic_custom_correction, synthetic_meas_filter
+from src.analysis.analysis import (PhysicalModel, ExperimentConfiguration, RunConfiguration, get_circuits_by_time_step,
+                                   get_circuits_by_time_vector)
+from src.analysis.error_mitigation import get_counts_result
+from src.analysis.execution import AerExecutor, simulate_circuits
+from src.analysis.folding import fold_gates
+from src.analysis.utils import get_all_spin_up_state, get_gauss_base_state
+from src.analysis.zne_extrapolation import custom_folding, extrapolate_zero_noise
+from src.models.circuits import SinglePlaquette
+from src.models.constants import Groups
+from src.models.peephole import optimize_plaquette_circuit
+from src.observables.gauss import gauss_law, gauss_law_squared
+
+SCALE_FACTORS = [1.0, 1.2, 1.5, 1.8, 2.0]
+
+# Modules of every import tier and the heavy dependencies importing them must not load
+IMPORT_TIERS = {
+    'models': ['src.models.lattice', 'src.models.hamiltonians', 'src.models.circuits', 'src.models.peephole'],
+    'analysis': ['src.observables.gauss', 'src.analysis.error_mitigation', 'src.analysis.zne_extrapolation',
+                 'src.analysis.shot_allocation', 'src.analysis.results_store', 'src.analysis.calibration_cache',
+                 'src.analysis.exact_evolution', 'src.analysis.batch_analysis'],
+    'execution': ['src.analysis.analysis', 'src.analysis.execution', 'src.analysis.noise_snapshot',
+                  'src.analysis.streaming', 'src.analysis.packing', 'src.analysis.run_manifest'],
+    'plotting': ['src.plotting.time_evolution'],
+}
+HEAVY_MODULES = {
+    'models': ['qiskit.providers.ibmq', 'qiskit.ignis', 'matplotlib', 'mitiq'],
+    'analysis': ['qiskit', 'matplotlib', 'mitiq'],
+    'execution': ['qiskit.providers.ibmq', 'qiskit.ignis', 'matplotlib', 'mitiq'],
+    'plotting': ['qiskit', 'matplotlib', 'mitiq'],
+}
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'heavy_modules': [name for name in {heavy_modules!r} if name in sys.modules]}}))
+"""
+
+
+def measure(stage: str, params: dict, function: Callable, repeats: int = 3) -> dict:
+    """
+    Returns the best wall time of several calls and the peak memory allocated by one traced call
+    """
+    times = list()
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    function()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'stage': stage, 'params': params, 'seconds': min(times), 'peak_memory_bytes': peak_memory}
+
+
+def bench_circuit_build(number_links_list: List[int]) -> List[dict]:
+    results = list()
+    for number_links, group in itertools.product(number_links_list, [Groups.Z2, Groups.U1]):
+        params = {'number_links': number_links, 'group': group}
+        results.append(measure('generate_circuit', params,
+                               lambda: SinglePlaquette(number_links + 1, 1.0, 1.0, gauge_group=group)
+                               .generate_circuit(1)))
+
+        circuit = SinglePlaquette(number_links + 1, 1.0, 1.0, gauge_group=group).generate_circuit(1)
+        results.append(measure('optimize_plaquette_circuit', params, lambda: optimize_plaquette_circuit(circuit)))
+    return results
+
+
+def bench_transpilation(number_links_list: List[int], time_lengths: List[int], backend) -> List[dict]:
+    results = list()
+    for number_links, zne in itertools.product(number_links_list, [False, True]):
+        circuit = SinglePlaquette(number_links + 1, 1.0, 1.0).generate_circuit(1)
+        params = {'number_links': number_links, 'zne': zne}
+        results.append(measure('get_circuits_by_time_step', params,
+                               lambda: get_circuits_by_time_step(circuit, zne, SCALE_FACTORS, backend, 2), repeats=1))
+
+        template = SinglePlaquette.with_time_parameter(number_links + 1).generate_circuit(1)
+        for time_length in time_lengths:
+            time_vector = list(np.linspace(0, 2, time_length))
+            results.append(measure('get_circuits_by_time_vector', dict(params, time_steps=time_length),
+                                   lambda: get_circuits_by_time_vector(template, time_vector, zne, SCALE_FACTORS,
+                                                                       backend, 2), repeats=1))
+    return results
+
+
+def bench_folding(number_links_list: List[int], backend) -> List[dict]:
+    results = list()
+    for number_links in number_links_list:
+        circuit = get_circuits_by_time_step(SinglePlaquette(number_links + 1).generate_circuit(1), False, [],
+                                            backend, 2)[0]
+        for scale in SCALE_FACTORS:
+            results.append(measure('custom_folding', {'number_links': number_links, 'scale_factor': scale},
+                                   lambda: custom_folding(circuit, scale)))
+        results.append(measure('fold_gates', {'number_links': number_links, 'scale_factors': len(SCALE_FACTORS)},
+                               lambda: fold_gates(circuit, SCALE_FACTORS)))
+    return results
+
+
+def bench_execution(number_links_list: List[int], time_lengths: List[int], backend) -> List[dict]:
+    results = list()
+    executor = AerExecutor(backend, seed=0)
+    for number_links, zne, time_length in itertools.product(number_links_list, [False, True], time_lengths):
+        params = {'number_links': number_links, 'zne': zne, 'time_steps': time_length}
+        physical_model = PhysicalModel(number_links=number_links)
+        experiment_config = ExperimentConfiguration(zne_extrapolation=zne, scale_factors=SCALE_FACTORS if zne else [])
+        run_config = RunConfiguration(time_vector=list(np.linspace(0, 2, time_length)), backend=backend)
+        results.append(measure('simulate_circuits', params,
+                               lambda: simulate_circuits(physical_model, experiment_config, run_config, executor),
+                               repeats=1))
+    return results
+
+
+def bench_counts_analysis(number_links_list: List[int], time_lengths: List[int], replicas: List[int]) -> List[dict]:
+    results = list()
+    for number_links, time_length, num_replicas in itertools.product(number_links_list, time_lengths, replicas):
+        n_qubits = number_links + 1
+        time_vector = list(np.linspace(0, 2, time_length))
+        number_experiments = time_length * len(SCALE_FACTORS) * num_replicas
+        result = SyntheticResult(number_experiments, n_qubits)
+        result_key, gauss_key = get_all_spin_up_state(number_links), get_gauss_base_state(number_links)
+        params = {'number_links': number_links, 'time_steps': time_length, 'replicas': num_replicas}
+
+        meas_filter = synthetic_meas_filter(n_qubits)
+        results.append(measure('get_counts_result_ignis', params,
+                               lambda: get_counts_result(None, result, result_key, gauss_key, time_vector, True,
+                                                         SCALE_FACTORS, num_replicas, ignis=True,
+                                                         meas_filter=meas_filter)))
+
+        correction = synthetic_custom_correction(n_qubits)
+        results.append(measure('get_counts_result_custom', params,
+                               lambda: get_counts_result(correction, result, result_key, gauss_key, time_vector, True,
+                                                         SCALE_FACTORS, num_replicas)))
+
+        counts = [result.get_counts(exp_ind) for exp_ind in range(number_experiments)]
+        results.append(measure('gauss_observables', params,
+                               lambda: [(gauss_law(exp_counts, exp_counts, 1000),
+                                         gauss_law_squared(exp_counts, exp_counts, 1000)) for exp_counts in counts]))
+
+        df_results = get_counts_result(None, result, result_key, gauss_key, time_vector, True, SCALE_FACTORS,
+                                       num_replicas, ignis=True, meas_filter=meas_filter)
+        results.append(measure('zne_aggregation', params, lambda: extrapolate_zero_noise(df_results)))
+    return results
+
+
+def measure_import(tier: str, module: str, repeats: int = 3) -> dict:
+    """
+    Returns the best time to import module in a fresh interpreter and the heavy dependencies of its tier it loaded
+    """
+    script = IMPORT_SCRIPT.format(module=module, heavy_modules=HEAVY_MODULES[tier])
+    measurements = [json.loads(subprocess.run([sys.executable, '-c', script], capture_output=True, text=True,
+                                              check=True).stdout) for _ in range(repeats)]
+
+    return {'stage': 'import', 'params': {'tier': tier, 'module': module},
+            'seconds': min(measurement['seconds'] for measurement in measurements),
+            'heavy_modules': measurements[0]['heavy_modules']}
+
+
+def bench_startup() -> List[dict]:
+    return [measure_import(tier, module) for tier, modules in IMPORT_TIERS.items() for module in modules]
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_benchmarks(number_links_list: List[int], time_lengths: List[int], replicas: List[int],
+                   stages: List[str]) -> dict:
+    backend = QasmSimulator()
+    results = list()
+    if 'startup' in stages:
+        results += bench_startup()
+    if 'build' in stages:
+        results += bench_circuit_build(number_links_list)
+    if 'transpile' in stages:
+        results += bench_transpilation(number_links_list, time_lengths, backend)
+    if 'fold' in stages:
+        results += bench_folding(number_links_list, backend)
+    if 'execute' in stages:
+        results += bench_execution(number_links_list, time_lengths, backend)
+    if 'analysis' in stages:
+        results += bench_counts_analysis(number_links_list, time_lengths, replicas)
+
+    return {
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+
+
+def compare(old_report: dict, new_report: dict):
+    def key(result):
+        return result['stage'], json.dumps(result['params'], sort_keys=True)
+
+    old_results = {key(result): result for result in old_report['results']}
+    print(f"{'stage':30} {'params':60} {'old (s)':>10} {'new (s)':>10} {'ratio':>7}")
+    for result in new_report['results']:
+        old_result = old_results.get(key(result))
+        if old_result is None:
+            continue
+        ratio = result['seconds'] / old_result['seconds'] if old_result['seconds'] else float('nan')
+        print(f"{result['stage']:30} {key(result)[1]:60} {old_result['seconds']:10.4f} {result['seconds']:10.4f} "
+              f"{ratio:7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the stages of the plaquette experiment pipeline')
+    parser.add_argument('--output', default='bench_output.json')
+    parser.add_argument('--links', type=int, nargs='+', default=[3, 4])
+    parser.add_argument('--time-steps', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--replicas', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--stages', nargs='+', default=['startup', 'build', 'transpile', 'fold', 'execute', 'analysis'])
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as old_file, open(args.compare[1]) as new_file:
+            compare(json.load(old_file), json.load(new_file))
+        return
+
+    report = run_benchmarks(args.links, args.time_steps, args.replicas, args.stages)
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+
+    # Importing a module of a tier must not load the dependencies of the tiers above it
+    violations = [result for result in report['results'] if result.get('heavy_modules')]
+    for result in violations:
+        print(f"{result['params']['module']} ({result['params']['tier']}) loads {', '.join(result['heavy_modules'])}")
+    if violations:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+import numpy as np
+
+from src.analysis.constants import MATRIX, STATES
+
+
+class SyntheticResult:
+    """
+    Stand-in for a qiskit Result holding random counts for every experiment
+    """
+
+    def __init__(self, number_experiments: int, n_qubits: int, shots: int = 1000, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        probabilities = rng.dirichlet(np.ones(2 ** n_qubits), size=number_experiments)
+        counts = np.array([rng.multinomial(shots, row) for row in probabilities])
+        states = [format(state, f'0{n_qubits}b') for state in range(2 ** n_qubits)]
+        self._counts = [{state: int(count) for state, count in zip(states, row) if count}
+                        for row in counts]
+        self.results = self._counts
+
+    def get_counts(self, experiment):
+        return self._counts[experiment]
+
+
+def synthetic_assignment_matrix(n_qubits: int, error: float = 0.03, seed: int = 0) -> np.ndarray:
+    """
+    Returns a column stochastic assignment matrix of independent readout errors
+    """
+    rng = np.random.default_rng(seed)
+    matrix = np.ones((1, 1))
+    for _ in range(n_qubits):
+        p01, p10 = rng.uniform(0, 2 * error, size=2)
+        matrix = np.kron(np.array([[1 - p10, p01], [p10, 1 - p01]]), matrix)
+
+    return matrix
+
+
+def synthetic_meas_filter(n_qubits: int):
+    from qiskit.ignis.mitigation import MeasurementFilter
+
+    states = [format(state, f'0{n_qubits}b') for state in range(2 ** n_qubits)]
+    return MeasurementFilter(synthetic_assignment_matrix(n_qubits), states)
+
+
+def synthetic_custom_correction(n_qubits: int) -> dict:
+    states = [format(state, f'0{n_qubits}b') for state in range(2 ** n_qubits)]
+    return {MATRIX: np.linalg.inv(synthetic_assignment_matrix(n_qubits).T), STATES: states}
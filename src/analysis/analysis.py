@@ -1,15 +1,33 @@
+from concurrent.futures import Executor
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import List, Optional, TYPE_CHECKING
 
 from qiskit import transpile, QuantumCircuit
-from qiskit.providers.ibmq import IBMQJobManager, IBMQBackend
+from qiskit.providers.models import BackendProperties
 from qiskit.result import Result
-
-from src.analysis.error_mitigation import get_counts_result
+from qiskit.transpiler import CouplingMap, PassManager
+from qiskit.transpiler.passes import Optimize1qGatesDecomposition
+
+from src.analysis import instrumentation
+from src.analysis.calibration_cache import get_calibration_date
+from src.analysis.constants import (BASIS_GATES, OPTIMIZATION_LEVEL, FOLDING_SEED, MAX_SHOTS, ZNE_ORDER, ZneMethods,
+                                    TRANSPILER_SEED)
+from src.analysis.error_mitigation import get_counts_result, get_exp_params
+from src.analysis.folding import fold_gates
+from src.analysis.parallel import get_executor, map_in_executor
+from src.analysis.shot_allocation import ShotAllocation, allocate_shots
+from src.analysis.transpilation_cache import TranspilationCache
 from src.analysis.utils import get_all_spin_up_state, get_gauss_base_state
-from src.analysis.zne_extrapolation import custom_folding
-from src.models.circuits import SinglePlaquette
+from src.models.circuits import SinglePlaquette, LatticePlaquettes
 from src.models.circuits import Groups
+from src.models.constants import Parameters
+from src.models.lattice import Lattice
+from src.models.peephole import optimize_plaquette_circuit
+from src.observables.engine import counts_to_array
+from src.observables.gauss import get_observable_weights, state_weights, GAUSS_LAW, SECTOR_2, GAUSS_LAW_SQUARED
+
+if TYPE_CHECKING:
+    from qiskit.providers.ibmq import IBMQJobManager, IBMQBackend
 
 
 @dataclass
@@ -19,6 +37,8 @@ class PhysicalModel:
     coupling: float = 1.0
     control_qubit: int = 1
     gauge: str = Groups.Z2
+    lattice: Optional[Lattice] = None  # Plaquettes sharing links, replaces the single plaquette when given
+    trotter_steps: int = 1
 
 
 @dataclass
@@ -28,22 +48,33 @@ class ExperimentConfiguration:
     scale_factors: List[float] = field(default_factory=list)
     optimisation_level: int = 2
     num_replicas: int = 1
+    seed_transpiler: Optional[int] = None
+    transpilation_cache: Optional[str] = None  # Directory where transpiled circuits are cached between runs
+    max_workers: Optional[int] = None  # Number of processes used to build the circuits, serial when None
+    peephole_optimization: bool = True  # Cancels the redundant gates of the generated circuit before transpiling
 
 
 @dataclass
 class RunConfiguration:
     time_vector: List[float]
-    backend: IBMQBackend
+    backend: 'IBMQBackend'
     shots: int = 1000
 
 
 def analyze_results(physical_model: PhysicalModel, experiment_configuration: ExperimentConfiguration,
                     run_configuration: RunConfiguration,
                     result_hpc: Result, result_key: Optional[str] = None, gauss_key: Optional[str] = None,
-                    mitigated_counts: dict = None, ignis: bool = True, meas_filter=None):
+                    mitigated_counts: dict = None, ignis: bool = True, meas_filter=None,
+                    observables: Optional[List[str]] = None, bootstrap_resamples: int = 0,
+                    bootstrap_seed: Optional[int] = None, shot_allocation: Optional[ShotAllocation] = None,
+                    allocation_results: Optional[list] = None):
     """
-    Returns an array with normalized counts for spin up states in the plaquette
+    Returns an array with normalized counts for spin up states in the plaquette. With bootstrap_resamples, replica
+    statistics come from resampling the measured counts, so a single execution with more shots can replace replicas.
+    With a shot allocation from allocate_run_shots, result_hpc holds the pilot and allocation_results the results of
+    the jobs of run_allocated_shots, in the same order
     """
+    check_single_plaquette(physical_model)
     number_links = physical_model.number_links
     time_vector = run_configuration.time_vector
     shots = run_configuration.shots
@@ -64,74 +95,303 @@ def analyze_results(physical_model: PhysicalModel, experiment_configuration: Exp
         pass
         # mitigated_counts = meas_filter.apply(result_hpc) if meas_filter else result_hpc
 
-    results_df = get_counts_result(mitigated_counts, result_hpc, result_key, gauss_key, time_vector,
-                                   zne_extrapolation, scale_factors, num_replicas, ignis=ignis, shots=shots,
-                                   meas_filter=meas_filter)
+    with instrumentation.span('analyze_results', ignis=ignis):
+        results_df = get_counts_result(mitigated_counts, result_hpc, result_key, gauss_key, time_vector,
+                                       zne_extrapolation, scale_factors, num_replicas, ignis=ignis, shots=shots,
+                                       meas_filter=meas_filter, control_qubit=physical_model.control_qubit,
+                                       observables=observables, bootstrap_resamples=bootstrap_resamples,
+                                       bootstrap_seed=bootstrap_seed, shot_allocation=shot_allocation,
+                                       allocation_results=allocation_results)
 
     return results_df
 
 
+def check_single_plaquette(physical_model: PhysicalModel):
+    # Result and gauss keys, and so the width of the counts, are only defined for a single plaquette
+    if physical_model.lattice is not None:
+        raise ValueError('Results of lattice runs can not be analyzed yet, their registers hold every lattice link '
+                         'and control qubit instead of a single plaquette')
+
+
 def run_circuits(physical_model: PhysicalModel, experiment_config: ExperimentConfiguration,
                  run_config: RunConfiguration) -> \
-        (IBMQJobManager, str, list):
-    number_links = physical_model.number_links
-    g = physical_model.coupling
-    model = physical_model.plaquette
-    group = physical_model.gauge
-    control_qubit = physical_model.control_qubit
+        ('IBMQJobManager', str, list):
+    from qiskit.providers.ibmq import IBMQJobManager
 
-    time_vector = run_config.time_vector
     backend = run_config.backend
     optimization_level = experiment_config.optimisation_level
     shots = run_config.shots
+
+    circuits = build_run_circuits(physical_model, experiment_config, run_config)
+    job_manager = IBMQJobManager()
+    with instrumentation.span('submit', circuits=len(circuits), shots=shots):
+        job_hpc = submit_circuits(job_manager, circuits, backend, shots, optimization_level)
+
+    job_set_id = job_hpc.job_set_id()
+
+    return job_manager, job_set_id, circuits
+
+
+def build_run_circuits(physical_model: PhysicalModel, experiment_config: ExperimentConfiguration,
+                       run_config: RunConfiguration) -> List[QuantumCircuit]:
+    """
+    Returns the circuits of every replica, time step and scale factor in the order of get_exp_params, transpiled for
+    the backend of the run configuration
+    """
+    time_vector = run_config.time_vector
+    backend = run_config.backend
+    optimization_level = experiment_config.optimisation_level
     zne_extrapolation = experiment_config.zne_extrapolation
     scale_factors = experiment_config.scale_factors
     num_replicas = experiment_config.num_replicas
+    seed = experiment_config.seed_transpiler
+    cache = TranspilationCache.from_config(experiment_config)
+
+    with instrumentation.span('build_template'):
+        template_circuit = build_template_circuit(physical_model)
+
+    if experiment_config.peephole_optimization:
+        template_circuit = peephole_optimize(template_circuit)
+
+    if backend is None:
+        raise ValueError("Backend cannot be None")
+
+    with get_executor(experiment_config.max_workers) as executor:
+        circuits = get_circuits_by_time_vector(template_circuit, time_vector, zne_extrapolation, scale_factors,
+                                               backend, optimization_level, cache=cache, seed=seed, executor=executor)
+
+    return circuits * num_replicas
+
+
+def allocate_run_shots(physical_model: PhysicalModel, experiment_config: ExperimentConfiguration,
+                       run_config: RunConfiguration, pilot_result: Result, target_error: float,
+                       observables: Optional[List[str]] = None, method: str = ZneMethods.POLYNOMIAL,
+                       order: int = ZNE_ORDER, shot_step: Optional[int] = None) -> ShotAllocation:
+    """
+    Returns the shots every circuit of run_circuits needs for the spin up probability and the observables to reach
+    the target error, given a pilot run with run_config.shots shots
+    """
+    check_single_plaquette(physical_model)
+    number_links = physical_model.number_links
+    result_key = get_all_spin_up_state(number_links)
+    gauss_key = get_gauss_base_state(number_links)
+    zne_extrapolation = experiment_config.zne_extrapolation
+    scale_factors = experiment_config.scale_factors
+    if observables is None:
+        observables = [GAUSS_LAW, SECTOR_2, GAUSS_LAW_SQUARED]
+
+    experiments_params = get_exp_params(run_config.time_vector, zne_extrapolation, scale_factors,
+                                        experiment_config.num_replicas)
+    counts_array = counts_to_array([pilot_result.get_counts(exp_ind) for exp_ind in range(len(experiments_params))],
+                                   len(result_key))
+    weights = {'original': state_weights(result_key)}
+    weights.update(get_observable_weights(observables, len(result_key), physical_model.control_qubit, gauss_key))
+    max_shots = getattr(run_config.backend.configuration(), 'max_shots', None) or MAX_SHOTS
+
+    with instrumentation.span('allocate_shots', experiments=len(experiments_params)):
+        return allocate_shots(counts_array, experiments_params, weights, target_error, zne_extrapolation,
+                              scale_factors, method=method, order=order, shot_step=shot_step, max_shots=max_shots)
+
+
+def run_allocated_shots(job_manager: 'IBMQJobManager', circuits: List[QuantumCircuit], allocation: ShotAllocation,
+                        backend: 'IBMQBackend', optimization_level: Optional[int]) -> List[str]:
+    """
+    Submits the additional shots of an allocation over the circuits returned by run_circuits, one job set per batch,
+    and returns the job set ids in the order expected by analyze_results
+    """
+    job_set_ids = list()
+    for batch_shots, experiments in allocation.get_batches():
+        with instrumentation.span('submit', circuits=len(experiments), shots=batch_shots):
+            job_set = submit_circuits(job_manager, [circuits[exp_ind] for exp_ind in experiments], backend,
+                                      batch_shots, optimization_level)
+        job_set_ids.append(job_set.job_set_id())
+
+    return job_set_ids
+
+
+def build_template_circuit(physical_model: PhysicalModel) -> QuantumCircuit:
+    """
+    Returns the circuit of the physical model with a symbolic time parameter
+    """
+    number_links = physical_model.number_links
+    g = physical_model.coupling
+    model = physical_model.plaquette
+    group = physical_model.gauge
+    control_qubit = physical_model.control_qubit
+
+    if physical_model.lattice is not None:
+        template = LatticePlaquettes.with_time_parameter(physical_model.lattice, g, gauge_group=group,
+                                                         trotter_steps=physical_model.trotter_steps)
+        return template.generate_circuit()
 
     if number_links != 4 and number_links != 3:
         print("Error: only triangular or square plaquettes are implemented")
         raise ValueError("Number of links can only be 3 or 4")
 
-    if backend is None:
-        raise ValueError("Backend cannot be None")
+    template = model.with_time_parameter(number_links + 1, g, gauge_group=group)
+    return template.generate_circuit(control_qubit)  # For Valencia, qubit 1 is the control qubit
 
-    circuits = []
 
-    for time_step in time_vector:
-        plaquette_obj = model(number_links + 1, time_step, g, gauge_group=group)
-        base_circuit = plaquette_obj.generate_circuit(control_qubit)  # For Valencia, qubit 1 is the control qubit
-        circuits_in_step = get_circuits_by_time_step(base_circuit, zne_extrapolation, scale_factors, backend,
-                                                     optimization_level)
+def peephole_optimize(circuit: QuantumCircuit) -> QuantumCircuit:
+    with instrumentation.span('peephole') as peephole_span:
+        optimized_circuit = optimize_plaquette_circuit(circuit)
+        if instrumentation.enabled():
+            peephole_span.set(before=instrumentation.circuit_stats([circuit]),
+                              after=instrumentation.circuit_stats([optimized_circuit]))
 
-        circuits.extend(circuits_in_step)
+    return optimized_circuit
 
+
+def submit_circuits(job_manager: 'IBMQJobManager', circuits: List[QuantumCircuit], backend: 'IBMQBackend', shots: int,
+                    optimization_level: Optional[int], name: Optional[str] = None):
     max_credits = 5  # max credits to spend on executions--the gui interface gives credit prices
 
-    circuits = circuits * num_replicas
-    job_manager = IBMQJobManager()
     if optimization_level is not None:
-        job_hpc = job_manager.run(circuits, backend=backend, shots=shots, max_credits=max_credits, optimization_level=0)
-    else:
-        job_hpc = job_manager.run(circuits, backend=backend, shots=shots, max_credits=max_credits)
+        return job_manager.run(circuits, backend=backend, shots=shots, max_credits=max_credits, optimization_level=0,
+                               name=name)
 
-    job_set_id = job_hpc.job_set_id()
+    return job_manager.run(circuits, backend=backend, shots=shots, max_credits=max_credits, name=name)
 
-    return job_manager, job_set_id, circuits
+
+def get_circuits_by_time_vector(template: QuantumCircuit, time_vector: List[float], zne: bool, scale_factors: list,
+                                backend: 'IBMQBackend', optimization_level: Optional[int],
+                                cache: Optional[TranspilationCache] = None,
+                                seed: Optional[int] = None,
+                                executor: Optional[Executor] = None) -> List[QuantumCircuit]:
+    """
+    Transpiles a circuit with a symbolic time parameter once and binds it to every time step, returning the circuits
+    ordered by time step first and scale factor second. Rotations of the bound circuits are merged over the executor
+    if given
+    """
+    template = prepare_template(template, zne, backend, optimization_level, cache=cache, seed=seed)
+    transpiled = zne or optimization_level is not None
+
+    return build_circuits(template, time_vector, zne, scale_factors, transpiled, executor=executor)
+
+
+def prepare_template(template: QuantumCircuit, zne: bool, backend: 'IBMQBackend', optimization_level: Optional[int],
+                     cache: Optional[TranspilationCache] = None, seed: Optional[int] = None) -> QuantumCircuit:
+    if zne or optimization_level is not None:
+        return transpile_circuit(template, backend, optimization_level, cache=cache, seed=seed)
+
+    return template
 
 
-def get_circuits_by_time_step(circuit: QuantumCircuit, zne: bool, scale_factors: list, backend: IBMQBackend,
-                              optimization_level: Optional[int]) -> List[QuantumCircuit]:
-    circuits_in_time_step = list()
+def build_circuits(template: QuantumCircuit, time_vector: List[float], zne: bool, scale_factors: list,
+                   transpiled: bool, executor: Optional[Executor] = None) -> List[QuantumCircuit]:
+    """
+    Folds the template once per scale factor, before binding, so every time step shares the folded structure
+    """
+    templates = [template]
+    if zne:
+        with instrumentation.span('fold', circuits=len(scale_factors)) as fold_span:
+            templates = fold_gates(template, scale_factors, seed=FOLDING_SEED)
+            if instrumentation.enabled():
+                fold_span.set(**instrumentation.circuit_stats(templates))
+
+    with instrumentation.span('bind', time_steps=len(time_vector), templates=len(templates)) as bind_span:
+        circuits_by_template = [bind_time_steps(folded_template, time_vector, merge_rotations=transpiled,
+                                                executor=executor) for folded_template in templates]
+        circuits = [circuit for time_step_circuits in zip(*circuits_by_template) for circuit in time_step_circuits]
+        if instrumentation.enabled():
+            bind_span.set(**instrumentation.circuit_stats(circuits))
+
+    return circuits
+
+
+def bind_time_steps(template: QuantumCircuit, time_vector: List[float], merge_rotations: bool = False,
+                    executor: Optional[Executor] = None) -> List[QuantumCircuit]:
+    time_parameters = [parameter for parameter in template.parameters if parameter.name == Parameters.TIME]
+    if not time_parameters:
+        return [template.copy() for _ in time_vector]
+
+    time_parameter = time_parameters[0]
+    circuits = [template.bind_parameters({time_parameter: time_step}) for time_step in time_vector]
+    if not merge_rotations:
+        return circuits
+
+    return map_in_executor(merge_single_qubit_rotations, circuits, executor=executor)
+
+
+def merge_single_qubit_rotations(circuit: QuantumCircuit) -> QuantumCircuit:
+    # Bound rotations are merged back into the surrounding single qubit gates, as a full transpilation would do
+    return PassManager(Optimize1qGatesDecomposition(BASIS_GATES)).run(circuit)
+
+
+def transpile_circuit(circuit: QuantumCircuit, backend: 'IBMQBackend', optimization_level: Optional[int],
+                      cache: Optional[TranspilationCache] = None, seed: Optional[int] = None,
+                      layout: Optional[List[int]] = None) -> QuantumCircuit:
+    """
+    Transpiles the circuit for the backend. With a layout, the circuit is transpiled for the device restricted to those
+    physical qubits, relabeled in the order of the layout, so routing never leaves them and noise aware passes read
+    the error rates of those qubits
+    """
+    if optimization_level is None:
+        optimization_level = OPTIMIZATION_LEVEL
+
+    coupling_map = backend_properties = None
+    if layout is not None:
+        coupling_map = CouplingMap(backend.configuration().coupling_map).reduce(layout).get_edges()
+        backend_properties = get_layout_properties(backend.properties(), layout)
+
+    if cache is not None and seed is None:
+        seed = TRANSPILER_SEED  # Cached circuits must be reproducible, which unseeded transpilations are not
+
+    with instrumentation.span('transpile', optimization_level=optimization_level) as transpile_span:
+        if cache is None:
+            transpiled_circuit = transpile(circuit, backend, basis_gates=BASIS_GATES, coupling_map=coupling_map,
+                                           backend_properties=backend_properties,
+                                           optimization_level=optimization_level, seed_transpiler=seed)
+        else:
+            key = TranspilationCache.get_key(circuit, backend.name(), BASIS_GATES,
+                                             coupling_map or backend.configuration().coupling_map,
+                                             optimization_level, seed, get_calibration_date(backend), layout)
+            transpiled_circuit = cache.get(key)
+            instrumentation.count('transpilation_cache_hits' if transpiled_circuit is not None
+                                  else 'transpilation_cache_misses')
+            if transpiled_circuit is None:
+                transpiled_circuit = transpile(circuit, backend, basis_gates=BASIS_GATES, coupling_map=coupling_map,
+                                               backend_properties=backend_properties,
+                                               optimization_level=optimization_level, seed_transpiler=seed)
+                cache.put(key, transpiled_circuit)
+
+        if instrumentation.enabled():
+            transpile_span.set(before=instrumentation.circuit_stats([circuit]),
+                               after=instrumentation.circuit_stats([transpiled_circuit]))
+
+    return transpiled_circuit
+
+
+def get_layout_properties(properties: Optional[BackendProperties], layout: List[int]) -> Optional[BackendProperties]:
+    """
+    Returns the calibrated properties of the physical qubits of the layout and the gates between them, relabeled as
+    the qubits of the coupling map reduced to the layout
+    """
+    if properties is None:
+        return None
+
+    qubit_indices = {physical_qubit: qubit for qubit, physical_qubit in enumerate(layout)}
+    properties_dict = properties.to_dict()
+    properties_dict['qubits'] = [properties_dict['qubits'][physical_qubit] for physical_qubit in layout]
+    properties_dict['gates'] = [dict(gate, qubits=[qubit_indices[qubit] for qubit in gate['qubits']])
+                                for gate in properties_dict['gates'] if set(gate['qubits']) <= qubit_indices.keys()]
+
+    return BackendProperties.from_dict(properties_dict)
+
+
+def get_circuits_by_time_step(circuit: QuantumCircuit, zne: bool, scale_factors: list, backend: 'IBMQBackend',
+                              optimization_level: Optional[int], transpiled: bool = False,
+                              cache: Optional[TranspilationCache] = None,
+                              seed: Optional[int] = None) -> List[QuantumCircuit]:
+    if not transpiled and (zne or optimization_level is not None):
+        circuit = transpile_circuit(circuit, backend, optimization_level, cache=cache, seed=seed)
+
     if not zne:
-        if optimization_level is not None:
-            circuit = transpile(circuit, backend, basis_gates=['id', 'u1', 'u2', 'u3', 'cx'], optimization_level=2)
         return [circuit]
 
-    for scale in scale_factors:
-        circuit = transpile(circuit, backend, basis_gates=['id', 'u1', 'u2', 'u3', 'cx'],
-                            optimization_level=2)
-
-        folded_circuit = custom_folding(circuit, scale, seed=150)
-        circuits_in_time_step.append(folded_circuit)
+    with instrumentation.span('fold', circuits=len(scale_factors)) as fold_span:
+        folded_circuits = fold_gates(circuit, scale_factors, seed=FOLDING_SEED)
+        if instrumentation.enabled():
+            fold_span.set(**instrumentation.circuit_stats(folded_circuits))
 
-    return circuits_in_time_step
+    return folded_circuits
@@ -0,0 +1,121 @@
+"""
+Analyzes every run of a ResultsStore directory in parallel and aggregates the results and their zero noise
+extrapolations in two tables, each row tagged with its run.
+
+    python -m src.analysis.batch_analysis runs/ --output results.csv --zne-output zne.csv --workers 8
+"""
+import argparse
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import pandas as pd
+
+from src.analysis import instrumentation
+from src.analysis.constants import CAL_MATRIX, STATE_LABELS, ZNE_ORDER, ZneMethods
+from src.analysis.error_mitigation import get_counts_dataframe
+from src.analysis.parallel import get_executor, map_in_executor
+from src.analysis.results_store import ResultsStore
+from src.analysis.utils import get_all_spin_up_state, get_gauss_base_state
+from src.analysis.zne_extrapolation import extrapolate_zero_noise
+from src.observables.gauss import DEFAULT_CONTROL_QUBIT
+
+KEY_COLUMNS = ['run', 'replica', 'scale_factor', 'time', 'shots']
+
+
+@dataclass
+class BatchAnalysisOptions:
+    observables: Optional[List[str]] = None
+    control_qubit: int = DEFAULT_CONTROL_QUBIT
+    zne_method: str = ZneMethods.POLYNOMIAL
+    zne_order: int = ZNE_ORDER
+    zne_columns: List[str] = field(default_factory=list)  # Every observable column when empty
+
+
+def analyze_stored_run(directory: str, run_id: str, options: BatchAnalysisOptions) -> (pd.DataFrame,
+                                                                                        Optional[pd.DataFrame]):
+    """
+    Analyzes a stored run with its stored calibration in a single vectorized mitigation and observables pass, and
+    extrapolates it to zero noise when it has scale factors. Run metadata can override the control qubit and the
+    result and gauss keys, which otherwise follow from the number of qubits of a single plaquette
+    """
+    store = ResultsStore(directory)
+    with instrumentation.span('load_run', run_id=run_id):
+        stored_run = store.load_run(run_id)
+        calibration = store.load_calibration(run_id)
+
+    metadata = stored_run.metadata
+    number_links = metadata['n_qubits'] - 1
+    result_key = metadata.get('result_key') or get_all_spin_up_state(number_links)
+    gauss_key = metadata.get('gauss_key') or get_gauss_base_state(number_links)
+    zne_extrapolation = bool(metadata.get('zne_extrapolation'))
+
+    meas_filter = None
+    if CAL_MATRIX in calibration:
+        from qiskit.ignis.mitigation import MeasurementFilter  # Only runs calibrated with ignis need it
+
+        meas_filter = MeasurementFilter(calibration.pop(CAL_MATRIX), calibration.pop(STATE_LABELS).tolist())
+
+    counts_array = stored_run.counts.astype(float)
+    results_df = get_counts_dataframe(counts_array, stored_run.experiments_params, calibration or None, result_key,
+                                      gauss_key, zne_extrapolation, ignis=meas_filter is not None,
+                                      shots=counts_array.sum(axis=1), meas_filter=meas_filter,
+                                      control_qubit=metadata.get('control_qubit', options.control_qubit),
+                                      observables=options.observables)
+    results_df.insert(0, 'run', run_id)
+
+    zne_df = None
+    if zne_extrapolation:
+        columns = options.zne_columns or [column for column in results_df.columns if column not in KEY_COLUMNS]
+        with instrumentation.span('zne', run_id=run_id, columns=len(columns)):
+            zne_df = extrapolate_zero_noise(results_df.drop(columns=['run', 'shots']), columns,
+                                            method=options.zne_method, order=options.zne_order)
+        zne_df.insert(0, 'run', run_id)
+
+    return results_df, zne_df
+
+
+def analyze_runs(directory: str, run_ids: Optional[List[str]] = None, options: Optional[BatchAnalysisOptions] = None,
+                 max_workers: Optional[int] = None) -> (pd.DataFrame, pd.DataFrame):
+    """
+    Analyzes the given runs of the store, all of them by default, over max_workers processes and returns the
+    concatenated results and zero noise extrapolations
+    """
+    options = options or BatchAnalysisOptions()
+    run_ids = run_ids if run_ids is not None else ResultsStore(directory).runs()
+
+    with instrumentation.span('analyze_runs', runs=len(run_ids), workers=max_workers):
+        with get_executor(max_workers) as executor:
+            analyses = map_in_executor(analyze_stored_run, [directory] * len(run_ids), run_ids,
+                                       [options] * len(run_ids), executor=executor)
+
+    results = [results_df for results_df, _ in analyses]
+    zne_results = [zne_df for _, zne_df in analyses if zne_df is not None]
+
+    return (pd.concat(results, ignore_index=True) if results else pd.DataFrame(),
+            pd.concat(zne_results, ignore_index=True) if zne_results else pd.DataFrame())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyze every stored run of a results directory')
+    parser.add_argument('directory')
+    parser.add_argument('--runs', nargs='+', help='Runs to analyze, all of them by default')
+    parser.add_argument('--output', default='results.csv')
+    parser.add_argument('--zne-output', default='zne.csv')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--observables', nargs='+', default=None)
+    parser.add_argument('--control-qubit', type=int, default=DEFAULT_CONTROL_QUBIT)
+    parser.add_argument('--method', default=ZneMethods.POLYNOMIAL,
+                        choices=[ZneMethods.POLYNOMIAL, ZneMethods.RICHARDSON, ZneMethods.EXPONENTIAL])
+    parser.add_argument('--order', type=int, default=ZNE_ORDER)
+    args = parser.parse_args()
+
+    options = BatchAnalysisOptions(observables=args.observables, control_qubit=args.control_qubit,
+                                   zne_method=args.method, zne_order=args.order)
+    results_df, zne_df = analyze_runs(args.directory, args.runs, options, max_workers=args.workers)
+    results_df.to_csv(args.output, index=False)
+    if not zne_df.empty:
+        zne_df.to_csv(args.zne_output, index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+from typing import Optional
+
+import numpy as np
+
+
+def resample_counts(counts_array: np.ndarray, num_resamples: int, seed: Optional[int] = None) -> np.ndarray:
+    """
+    Returns a (num_resamples x experiments x 2^n) array of counts drawn from the multinomial distribution of every
+    measured experiment, with the same number of shots
+    """
+    rng = np.random.default_rng(seed)
+    counts_array = np.asarray(counts_array, dtype=float)
+    shots = counts_array.sum(axis=1)
+    probabilities = counts_array / np.where(shots > 0, shots, 1)[:, None]
+
+    resamples = np.empty((num_resamples,) + counts_array.shape, dtype=np.int64)
+    for exp_ind, (exp_shots, exp_probabilities) in enumerate(zip(shots.astype(np.int64), probabilities)):
+        resamples[:, exp_ind] = rng.multinomial(exp_shots, exp_probabilities, size=num_resamples)
+
+    return resamples
+
+
+def bootstrap_replicas(counts_array: np.ndarray, experiments_params: np.ndarray, num_resamples: int,
+                       seed: Optional[int] = None) -> (np.ndarray, np.ndarray):
+    """
+    Returns resampled counts and their rows of get_exp_params, where every resample of the measured replicas becomes a
+    new set of replicas. The result can be analyzed, mitigated and extrapolated as if the replicas had been executed
+    """
+    num_replicas = int(experiments_params[:, -1].max()) + 1
+    resamples = resample_counts(counts_array, num_resamples, seed)
+
+    resampled_params = np.tile(experiments_params, (num_resamples, 1))
+    resample_ind = np.repeat(np.arange(num_resamples), len(experiments_params))
+    resampled_params[:, -1] = resample_ind * num_replicas + resampled_params[:, -1]
+
+    return resamples.reshape(-1, counts_array.shape[1]), resampled_params
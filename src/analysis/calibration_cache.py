@@ -0,0 +1,69 @@
+import hashlib
+import json
+import time
+from typing import List, Optional
+
+import numpy as np
+
+from src.analysis.constants import CALIBRATION_CACHE_SIZE, CALIBRATION_MAX_AGE
+from src.analysis.disk_cache import DiskCache
+from src.analysis.results_store import get_calibration_arrays, read_calibration_arrays
+
+CREATED_AT = 'created_at'
+
+
+class CalibrationCache(DiskCache):
+    """
+    On-disk cache of readout calibrations stored as compressed npz files. Keys include the date of the last device
+    calibration, so entries go stale as soon as the device recalibrates. Entries older than max_age seconds are dropped
+    when read, and the least recently used ones are evicted once the directory grows beyond max_size bytes
+    """
+    extension = '.npz'
+
+    def __init__(self, directory: str, max_size: int = CALIBRATION_CACHE_SIZE,
+                 max_age: Optional[float] = CALIBRATION_MAX_AGE):
+        super().__init__(directory, max_size)
+        self.max_age = max_age
+
+    @staticmethod
+    def get_key(method: str, backend, qubits: List[int], shots: int, clusters: Optional[list] = None) -> str:
+        key = {
+            'method': method,
+            'backend': backend.name(),
+            'qubits': list(qubits),
+            'shots': shots,
+            'clusters': clusters,
+            'calibration_date': get_calibration_date(backend),
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+    def dump(self, arrays: dict, file):
+        np.savez_compressed(file, **arrays)
+
+    def load(self, path: str) -> Optional[dict]:
+        """
+        Returns the calibration in the format of the error mitigation classes, None when too old
+        """
+        with np.load(path) as arrays:
+            calibration = read_calibration_arrays(arrays)
+        created_at = float(calibration.pop(CREATED_AT))
+        if self.max_age is not None and time.time() - created_at > self.max_age:
+            return None
+
+        return calibration
+
+    def put(self, key: str, error_correction: Optional[dict] = None, meas_filter=None):
+        arrays = get_calibration_arrays(error_correction, meas_filter)
+        arrays[CREATED_AT] = time.time()
+        super().put(key, arrays)
+
+
+def get_calibration_date(backend) -> Optional[str]:
+    """
+    Returns the date of the last calibration of the device, None for backends without properties such as simulators
+    """
+    properties = backend.properties() if hasattr(backend, 'properties') else None
+    if properties is None:
+        return None
+
+    return str(properties.last_update_date)
@@ -1,6 +1,27 @@
-from qiskit import IBMQ
-
 SIMULATOR = 'ibmq_qasm_simulator'
 
 MATRIX = 'matrix'
 STATES = 'states'
+MATRICES = 'matrices'
+CLUSTERS = 'clusters'
+CAL_MATRIX = 'cal_matrix'
+STATE_LABELS = 'state_labels'
+SNAPSHOT_CONFIGURATION = 'configuration'
+SNAPSHOT_PROPERTIES = 'properties'
+
+BASIS_GATES = ['id', 'u1', 'u2', 'u3', 'cx']
+OPTIMIZATION_LEVEL = 2
+TRANSPILATION_CACHE_SIZE = 512 * 1024 ** 2  # bytes
+CALIBRATION_CACHE_SIZE = 64 * 1024 ** 2  # bytes
+CALIBRATION_MAX_AGE = 24 * 3600  # seconds
+FOLDING_SEED = 150
+TRANSPILER_SEED = 150  # Used when caching transpilations without a seed_transpiler
+DENSE_LATTICE_LINKS = 12
+ZNE_ORDER = 2
+MAX_SHOTS = 8192
+
+
+class ZneMethods:
+    POLYNOMIAL = 'polynomial'
+    RICHARDSON = 'richardson'
+    EXPONENTIAL = 'exponential'
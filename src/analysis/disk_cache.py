@@ -0,0 +1,69 @@
+import os
+from abc import ABC, abstractmethod
+
+
+class DiskCache(ABC):
+    """
+    On-disk cache storing one file per key. Entries are marked as recently used when read, and the least recently used
+    ones are evicted once the directory grows beyond max_size bytes. Subclasses write and read the entries
+    """
+    extension = ''
+
+    def __init__(self, directory: str, max_size: int):
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    @abstractmethod
+    def dump(self, value, file):
+        pass
+
+    @abstractmethod
+    def load(self, path: str):
+        """
+        Returns the entry stored in path, None when it is no longer valid
+        """
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.extension)
+
+    def get(self, key: str):
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+
+        value = self.load(path)
+        if value is None:
+            os.remove(path)
+            return None
+        os.utime(path)  # Mark the entry as recently used
+
+        return value
+
+    def put(self, key: str, value):
+        path = self._path(key)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as file:
+            self.dump(value, file)
+        os.replace(temp_path, path)
+
+        self.evict()
+
+    def evict(self):
+        entries = list()
+        for filename in os.listdir(self.directory):
+            if filename.endswith(self.extension):
+                stat = os.stat(os.path.join(self.directory, filename))
+                entries.append((stat.st_mtime, stat.st_size, filename))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, filename in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            os.remove(os.path.join(self.directory, filename))
+            total_size -= size
+
+    def clear(self):
+        for filename in os.listdir(self.directory):
+            if filename.endswith(self.extension):
+                os.remove(os.path.join(self.directory, filename))
@@ -1,81 +1,110 @@
 import itertools
 import json
+from typing import List, Optional, Union, TYPE_CHECKING
 
 import numpy as np
 import pandas as pd
-from qiskit import QuantumRegister, QuantumCircuit, ClassicalRegister, execute
-from qiskit.ignis.mitigation import complete_meas_cal, CompleteMeasFitter
-from qiskit.providers.ibmq import IBMQBackend
 
-from src.analysis.constants import MATRIX, STATES
-from src.observables.gauss import gauss_law, sector_2, gauss_law_squared
+from src.analysis import instrumentation
+from src.analysis.bootstrap import bootstrap_replicas
+from src.analysis.calibration_cache import CalibrationCache
+from src.analysis.constants import MATRIX, STATES, MATRICES, CLUSTERS, CAL_MATRIX, STATE_LABELS
+from src.analysis.shot_allocation import ShotAllocation
+from src.observables.engine import counts_to_array, evaluate_observables, state_index
+from src.observables.gauss import get_observable_weights, DEFAULT_CONTROL_QUBIT, GAUSS_LAW, GAUSS_LAW_SQUARED, SECTOR_2
+
+if TYPE_CHECKING:
+    from qiskit.providers.ibmq import IBMQBackend
 
 
 def get_counts_result(output_correction, result_hpc, result_key: str, gauss_key: str, time_vector: list,
                       zne_extrapolation: bool, scale_factors: list, num_replicas: int, ignis: bool = False,
-                      shots: int = 1000, meas_filter=None) -> (list, list):
-    results = list()
+                      shots: int = 1000, meas_filter=None, control_qubit: int = DEFAULT_CONTROL_QUBIT,
+                      observables: Optional[List[str]] = None, bootstrap_resamples: int = 0,
+                      bootstrap_seed: Optional[int] = None, shot_allocation: Optional[ShotAllocation] = None,
+                      allocation_results: Optional[list] = None) -> (list, list):
+    """
+    Returns a dataframe with the spin up probability and, when using ignis or a tensored calibration, the requested
+    registered observables for every experiment, before and after readout error mitigation. With bootstrap_resamples,
+    the replicas are multinomial resamples of the measured counts instead of the executed replicas. With a shot
+    allocation, the counts of the results of its batches are added to the pilot counts in result_hpc and every
+    experiment is normalized by its own shots
+    """
     experiments_params = get_exp_params(time_vector, zne_extrapolation, scale_factors, num_replicas)
     time_steps = len(time_vector)
     num_scales = len(scale_factors) if zne_extrapolation else 1
 
-    for exp_ind in range(time_steps * num_scales * num_replicas):
-        non_corrected_counts = result_hpc.get_counts(exp_ind)
-        one_count = non_corrected_counts.get(result_key, 0) / shots
-        experiment_result = dict()
-        replica_ind = experiments_params[exp_ind][-1]
-
-        experiment_result.update({
-            'replica': replica_ind,
-        })
-
-        if zne_extrapolation:
-            time_ind = experiments_params[exp_ind][0]
-            scale_ind = experiments_params[exp_ind][1]
-            experiment_result.update({
-                'scale_factor': scale_ind,
-            })
-        else:
-            time_ind = experiments_params[exp_ind][0]
-
-        experiment_result.update({
-            'time': time_ind
-        })
-
+    with instrumentation.span('retrieve_counts', experiments=len(experiments_params)):
+        counts_list = [result_hpc.get_counts(exp_ind) for exp_ind in range(time_steps * num_scales * num_replicas)]
+        counts_array = counts_to_array(counts_list, len(result_key))
+        if shot_allocation is not None:
+            counts_array = shot_allocation.merge_counts(counts_array, allocation_results or [])
+            shots = shot_allocation.shots
+
+    if bootstrap_resamples:
+        with instrumentation.span('bootstrap', resamples=bootstrap_resamples):
+            counts_array, experiments_params = bootstrap_replicas(counts_array, experiments_params,
+                                                                  bootstrap_resamples, seed=bootstrap_seed)
+            if np.ndim(shots):
+                shots = np.tile(shots, bootstrap_resamples)
+
+    return get_counts_dataframe(counts_array, experiments_params, output_correction, result_key, gauss_key,
+                                zne_extrapolation, ignis=ignis, shots=shots, meas_filter=meas_filter,
+                                control_qubit=control_qubit, observables=observables)
+
+
+def get_counts_dataframe(counts_array: np.ndarray, experiments_params: np.ndarray, output_correction,
+                         result_key: str, gauss_key: str, zne_extrapolation: bool, ignis: bool = False,
+                         shots: Union[int, np.ndarray] = 1000, meas_filter=None,
+                         control_qubit: int = DEFAULT_CONTROL_QUBIT,
+                         observables: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Same as get_counts_result for a dense counts array whose rows match the given rows of get_exp_params. Shots can be
+    given per experiment, in which case they are added as a column
+    """
+    if observables is None:
+        observables = [GAUSS_LAW, SECTOR_2, GAUSS_LAW_SQUARED]
+
+    n_qubits = len(result_key)
+    results = {'replica': experiments_params[:, -1]}
+    if zne_extrapolation:
+        results['scale_factor'] = experiments_params[:, 1]
+    results['time'] = experiments_params[:, 0]
+    if np.ndim(shots):
+        results['shots'] = shots
+
+    corrected_array = None
+    with instrumentation.span('mitigation', experiments=len(counts_array), ignis=ignis):
         if ignis:
-            corrected_counts = meas_filter.apply(non_corrected_counts)
-            corrected_one_count = apply_ignis_error_correction(corrected_counts, exp_ind, result_key, shots)
-            gauss_law_obs, gauss_law_obs_corrected = gauss_law(non_corrected_counts, corrected_counts, shots)
-            sector_2_obs, sector_2_obs_corrected = sector_2(gauss_key, non_corrected_counts, corrected_counts,
-                                                            shots)
-            gauss_law_sq_obs, gauss_law_sq_obs_corrected = gauss_law_squared(non_corrected_counts, corrected_counts,
-                                                                             shots)
-            experiment_result.update({
-                'gauss_law': gauss_law_obs,
-                'gauss_law_corrected': gauss_law_obs_corrected,
-                'sector_2': sector_2_obs,
-                'sector_2_corrected': sector_2_obs_corrected,
-                'gauss_law_squared': gauss_law_sq_obs,
-                'gauss_law_squared_corrected': gauss_law_sq_obs_corrected,
-            })
+            corrected_array = apply_meas_filter(meas_filter, counts_array)
+        elif is_tensored_correction(output_correction):
+            corrected_array = apply_tensored_correction(counts_array, output_correction)
         else:
-            corrected_one_count = apply_error_correction(non_corrected_counts, output_correction, result_key, shots)
+            corrected_one_count = apply_error_correction_batch(counts_array, output_correction, result_key, shots)
 
-        experiment_result.update({
-            'original': one_count,
-            'output_corrected': corrected_one_count,
-        })
+    if corrected_array is not None:
+        with instrumentation.span('observables', observables=len(observables)):
+            weights = get_observable_weights(observables, n_qubits, control_qubit, gauss_key)
+            observable_values = evaluate_observables(counts_array, weights, shots)
+            corrected_observables = evaluate_observables(corrected_array, weights, shots)
+            for name in weights.keys():
+                results[name] = observable_values[name]
+                results[name + '_corrected'] = corrected_observables[name]
 
-        results.append(experiment_result)
+        corrected_one_count = corrected_array[:, state_index(result_key)] / shots
 
-    results_df = pd.DataFrame(results)
+    results['original'] = counts_array[:, state_index(result_key)] / shots
+    results['output_corrected'] = corrected_one_count
+
+    with instrumentation.span('dataframe'):
+        results_df = pd.DataFrame(results)
 
     return results_df
 
 
 def apply_error_correction(experiment_data, error_correction: dict, result_key: str, shots: int = 1000):
     if error_correction is None:
-        return experiment_data.get(result_key, 0)
+        return experiment_data.get(result_key, 0) / shots
 
     possible_states = error_correction.get(STATES)
     row_to_choose = possible_states.index(result_key)
@@ -90,14 +119,76 @@ def apply_error_correction(experiment_data, error_correction: dict, result_key:
     return res
 
 
+def apply_error_correction_batch(counts_array: np.ndarray, error_correction: dict, result_key: str,
+                                 shots: int = 1000) -> np.ndarray:
+    """
+    Same as apply_error_correction for every row of a dense counts array in a single matrix product
+    """
+    if error_correction is None:
+        return counts_array[:, state_index(result_key)] / shots
+
+    possible_states = error_correction.get(STATES)
+    row_to_choose = possible_states.index(result_key)
+    correction_vector = np.asarray(error_correction.get(MATRIX))[row_to_choose]
+    state_indices = [state_index(state) for state in possible_states]
+
+    return counts_array[:, state_indices] @ correction_vector / shots
+
+
+def apply_meas_filter(meas_filter, counts_array: np.ndarray) -> np.ndarray:
+    """
+    Applies an ignis measurement filter to every row of a dense counts array. The calibration matrix is inverted once
+    for all experiments, and only those whose exact inverse has negative counts go through the constrained least
+    squares solve of the filter, which otherwise has the same solution
+    """
+    state_labels = list(meas_filter.state_labels)
+    state_indices = [state_index(label) for label in state_labels]
+    raw_counts = counts_array[:, state_indices]
+    corrected_counts = raw_counts @ np.linalg.pinv(meas_filter.cal_matrix).T
+
+    for exp_ind in np.flatnonzero((corrected_counts < 0).any(axis=1)):
+        mitigated_counts = meas_filter.apply(dict(zip(state_labels, raw_counts[exp_ind])))
+        corrected_counts[exp_ind] = [mitigated_counts.get(label, 0) for label in state_labels]
+
+    corrected_array = np.zeros_like(counts_array)
+    corrected_array[:, state_indices] = corrected_counts
+
+    return corrected_array
+
+
+def is_tensored_correction(error_correction: Optional[dict]) -> bool:
+    return error_correction is not None and CLUSTERS in error_correction
+
+
+def apply_tensored_correction(counts_array: np.ndarray, error_correction: dict) -> np.ndarray:
+    """
+    Applies the inverse assignment matrix of every cluster to the matching axes of the counts array reshaped as a
+    tensor, so the full 2^n x 2^n correction matrix is never built
+    """
+    n_qubits = counts_array.shape[1].bit_length() - 1
+    corrected = counts_array.reshape((-1,) + (2,) * n_qubits)
+
+    for cluster, inverse in zip(error_correction.get(CLUSTERS), error_correction.get(MATRICES)):
+        # Axis 0 holds the experiments and qubit 0 is the last axis, the cluster's last qubit is its leading bit
+        axes = [n_qubits - q_ind for q_ind in cluster[::-1]]
+        last_axes = list(range(-len(cluster), 0))
+        moved = np.moveaxis(corrected, axes, last_axes)
+        shape = moved.shape
+        moved = moved.reshape(shape[:-len(cluster)] + (2 ** len(cluster),)) @ np.asarray(inverse).T
+        corrected = np.moveaxis(moved.reshape(shape), last_axes, axes)
+
+    return corrected.reshape(counts_array.shape)
+
+
 def apply_ignis_error_correction(mitigated_counts, circ_ind: int, result_key: str, shots: int):
     return mitigated_counts.get(result_key, 0) / shots
 
 
 class CustomErrorMitigation:
-    def __init__(self, n_qubits: int = 4, shots: int = 1000):
+    def __init__(self, n_qubits: int = 4, shots: int = 1000, initial_layout: Optional[List[int]] = None):
         self.n_qubits = n_qubits
         self.shots = shots
+        self.initial_layout = initial_layout  # Physical qubits calibrated, the first n_qubits when None
 
     def _build_set_of_states(self):
         possible_states = list()
@@ -118,6 +209,8 @@ class CustomErrorMitigation:
     def _build_circuit(self, initial_state: str):
         if self.n_qubits != len(initial_state):
             raise Exception('Error in parameters, number of qubits does not agree with initial_state')
+        from qiskit import QuantumRegister, QuantumCircuit, ClassicalRegister
+
         q = QuantumRegister(self.n_qubits, 'q')
         circ = QuantumCircuit(q)
         for q_ind, q_state in enumerate(initial_state[::-1]):  # Flipping the state to map to qubit order
@@ -131,7 +224,19 @@ class CustomErrorMitigation:
 
         return qc
 
-    def build_probability_matrix(self, backend: IBMQBackend):
+    def build_probability_matrix(self, backend: 'IBMQBackend', cache: Optional[CalibrationCache] = None):
+        """
+        Returns the inverse of the probability matrix, from the cache when the device has not been recalibrated since
+        it was stored
+        """
+        key = None
+        if cache is not None:
+            key = CalibrationCache.get_key('custom', backend, get_layout(self.n_qubits, self.initial_layout),
+                                           self.shots)
+            error_correction = cache.get(key)
+            if error_correction is not None:
+                return error_correction
+
         possible_states = self._build_set_of_states()
         probability_matrix = list()
         circuits = list()
@@ -139,13 +244,20 @@ class CustomErrorMitigation:
             qc = self._build_circuit(initial_state)
             circuits.append(qc)
 
-        job_hpc = execute(circuits, backend=backend, shots=self.shots, max_credits=5)
+        from qiskit import execute
+
+        job_hpc = execute(circuits, backend=backend, shots=self.shots, max_credits=5,
+                          initial_layout=self.initial_layout)
         result_hpc = job_hpc.result()
 
         for ind, _ in enumerate(possible_states):
             probability_matrix.append(self._get_probabilities_vector(result_hpc.get_counts(circuits[ind])))
 
-        return {MATRIX: np.linalg.inv(probability_matrix), STATES: possible_states}
+        error_correction = {MATRIX: np.linalg.inv(probability_matrix), STATES: possible_states}
+        if cache is not None:
+            cache.put(key, error_correction=error_correction)
+
+        return error_correction
 
     @staticmethod
     def save_correction_results(error_correction: dict, filename: str):
@@ -159,20 +271,108 @@ class CustomErrorMitigation:
         return error_correction
 
 
+class TensoredErrorMitigation:
+    """
+    Readout calibration assuming errors are only correlated within clusters of qubits, by default single qubits. It
+    needs 2^k circuits for clusters of at most k qubits, all clusters being calibrated in parallel
+    """
+
+    def __init__(self, n_qubits: int = 4, shots: int = 1000, clusters: Optional[List[List[int]]] = None,
+                 initial_layout: Optional[List[int]] = None):
+        self.n_qubits = n_qubits
+        self.shots = shots
+        self.clusters = clusters if clusters is not None else [[q_ind] for q_ind in range(n_qubits)]
+        self.initial_layout = initial_layout
+
+    def _build_circuit(self, prepared_state: int):
+        from qiskit import QuantumRegister, QuantumCircuit, ClassicalRegister
+
+        q = QuantumRegister(self.n_qubits, 'q')
+        circ = QuantumCircuit(q)
+        for cluster in self.clusters:
+            local_state = prepared_state % 2 ** len(cluster)
+            for bit_ind, q_ind in enumerate(cluster):
+                if (local_state >> bit_ind) & 1:
+                    circ.x(q[q_ind])
+
+        c = ClassicalRegister(self.n_qubits, 'c')
+        meas = QuantumCircuit(q, c)
+        meas.measure(q, c)
+        qc = circ + meas
+
+        return qc
+
+    def build_probability_matrices(self, backend: 'IBMQBackend', cache: Optional[CalibrationCache] = None):
+        """
+        Returns the inverse of the assignment matrix of each cluster, where entry (i, j) of an assignment matrix is the
+        probability of measuring the cluster in state i after preparing it in state j. Cached calibrations are reused
+        until the device recalibrates
+        """
+        key = None
+        if cache is not None:
+            key = CalibrationCache.get_key('tensored', backend, get_layout(self.n_qubits, self.initial_layout),
+                                           self.shots, clusters=self.clusters)
+            error_correction = cache.get(key)
+            if error_correction is not None:
+                return error_correction
+
+        num_states = 2 ** max(len(cluster) for cluster in self.clusters)
+        circuits = [self._build_circuit(prepared_state) for prepared_state in range(num_states)]
+
+        from qiskit import execute
+
+        job_hpc = execute(circuits, backend=backend, shots=self.shots, max_credits=5,
+                          initial_layout=self.initial_layout)
+        result_hpc = job_hpc.result()
+
+        matrices = [np.zeros((2 ** len(cluster), 2 ** len(cluster))) for cluster in self.clusters]
+        for prepared_state, circuit in enumerate(circuits):
+            for state, count in result_hpc.get_counts(circuit).items():
+                qubits = state.replace(' ', '')[::-1]  # Flipping the state to map to qubit order
+                for cluster, matrix in zip(self.clusters, matrices):
+                    measured = sum(int(qubits[q_ind]) << bit_ind for bit_ind, q_ind in enumerate(cluster))
+                    matrix[measured, prepared_state % len(matrix)] += count
+
+        inverses = [np.linalg.inv(matrix / matrix.sum(axis=0)).tolist() for matrix in matrices]
+        error_correction = {MATRICES: inverses, CLUSTERS: self.clusters}
+        if cache is not None:
+            cache.put(key, error_correction=error_correction)
+
+        return error_correction
+
+
 class IgnisErrorMitigation:
-    def __init__(self, n_qubits: int = 4, shots: int = 1000):
+    def __init__(self, n_qubits: int = 4, shots: int = 1000, initial_layout: Optional[List[int]] = None):
         self.n_qubits = n_qubits
         self.shots = shots
+        self.initial_layout = initial_layout
         self.meas_fitter = None
 
-    def get_meas_fitter(self, backend: IBMQBackend):
+    def get_meas_fitter(self, backend: 'IBMQBackend', cache: Optional[CalibrationCache] = None):
+        """
+        Returns the measurement filter of the fitted calibration. A cached calibration gives the filter without
+        running the calibration circuits, in which case there is no fitter to plot
+        """
+        from qiskit import execute
+        from qiskit.ignis.mitigation import complete_meas_cal, CompleteMeasFitter, MeasurementFilter
+
+        key = None
+        if cache is not None:
+            key = CalibrationCache.get_key('ignis', backend, get_layout(self.n_qubits, self.initial_layout),
+                                           self.shots)
+            calibration = cache.get(key)
+            if calibration is not None:
+                self.meas_fitter = None  # A fitter of a previous calibration would not match the returned filter
+                return MeasurementFilter(calibration[CAL_MATRIX], calibration[STATE_LABELS].tolist())
+
         q_bits = list(range(self.n_qubits))
         cal_circuits, state_labels = complete_meas_cal(qubit_list=q_bits, circlabel='mitigationError')
 
         cal_job = execute(cal_circuits,
                           backend=backend,
                           shots=self.shots,
-                          optimization_level=0)
+                          optimization_level=0,
+                          initial_layout=self.initial_layout)
 
         cal_results = cal_job.result()
         meas_fitter = CompleteMeasFitter(cal_results, state_labels)
@@ -180,12 +380,22 @@ class IgnisErrorMitigation:
         filter_obj = meas_fitter.filter
         filter_obj._state_labels = list(sep_labs)
         self.meas_fitter = meas_fitter
+        if cache is not None:
+            cache.put(key, meas_filter=filter_obj)
+
         return meas_fitter.filter
 
     def plot_calibration(self):
+        if self.meas_fitter is None:
+            raise ValueError('There is no fitted calibration to plot, get_meas_fitter has not run the calibration '
+                             'circuits or returned a cached calibration')
         self.meas_fitter.plot_calibration()
 
 
+def get_layout(n_qubits: int, initial_layout: Optional[List[int]]) -> List[int]:
+    return list(initial_layout) if initial_layout is not None else list(range(n_qubits))
+
+
 def get_exp_params(time_vector: list, zne_extrapolation: bool, scale_factors: list, num_replicas: int):
     replicas = list(range(num_replicas))
     if not zne_extrapolation:
@@ -0,0 +1,114 @@
+from functools import lru_cache, reduce
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+from scipy.sparse.linalg import expm_multiply
+
+from src.analysis.constants import DENSE_LATTICE_LINKS
+from src.analysis.utils import get_all_spin_up_state, get_gauss_base_state
+from src.models.constants import Groups
+from src.models.hamiltonians import lattice_hamiltonian, plaquette_hamiltonian
+from src.models.lattice import Lattice
+from src.observables.engine import evaluate_observables, state_index
+from src.observables.gauss import get_observable_weights, GAUSS_LAW, GAUSS_LAW_SQUARED, SECTOR_2
+
+
+def u2_matrix(phi: float, lam: float) -> np.ndarray:
+    return np.array([[1, -np.exp(1j * lam)], [np.exp(1j * phi), np.exp(1j * (phi + lam))]]) / np.sqrt(2)
+
+
+def single_qubit_operator(gates: dict, n_qubits: int) -> np.ndarray:
+    return reduce(np.kron, [gates.get(q_ind, np.eye(2)) for q_ind in reversed(range(n_qubits))])
+
+
+def get_basis_changes(gauge_group: str, number_links: int, control_qubit: int) -> (np.ndarray, np.ndarray):
+    """
+    Returns the initial state and the final rotation surrounding the evolution in the SinglePlaquette circuits
+    """
+    n_qubits = number_links + 1
+    initial_state = np.zeros(2 ** n_qubits, dtype=complex)
+    initial_state[0] = 1.0
+    if number_links == 4:
+        return initial_state, np.eye(2 ** n_qubits)
+
+    preparation = {control_qubit: u2_matrix(np.pi / 2, np.pi / 2)}
+    if gauge_group == Groups.U1:
+        preparation.update({q_ind: np.array([[0, 1], [1, 0]]) for q_ind in range(n_qubits) if q_ind != control_qubit})
+
+    final_rotation = single_qubit_operator({control_qubit: u2_matrix(-np.pi / 2, -np.pi / 2)}, n_qubits)
+
+    return single_qubit_operator(preparation, n_qubits) @ initial_state, final_rotation
+
+
+@lru_cache(maxsize=None)
+def get_eigendecomposition(gauge_group: str, number_links: int, g: float, control_qubit: int):
+    hamiltonian = plaquette_hamiltonian(gauge_group, number_links, g, control_qubit)
+    return np.linalg.eigh(hamiltonian)
+
+
+def exact_probabilities(gauge_group: str, number_links: int, time_vector: List[float], g: float = 1.0,
+                        control_qubit: int = 1) -> np.ndarray:
+    """
+    Returns a (time steps x 2^n_qubits) array with the exact probability of measuring every basis state
+    """
+    energies, eigenvectors = get_eigendecomposition(gauge_group, number_links, g, control_qubit)
+    initial_state, final_rotation = get_basis_changes(gauge_group, number_links, control_qubit)
+
+    phases = np.exp(-1j * np.outer(np.asarray(time_vector, dtype=float), energies))
+    amplitudes = (phases * (eigenvectors.conj().T @ initial_state)) @ (final_rotation @ eigenvectors).T
+
+    return np.abs(amplitudes) ** 2
+
+
+def exact_results(gauge_group: str, number_links: int, time_vector: List[float], g: float = 1.0,
+                  control_qubit: int = 1, observables: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Returns a dataframe with the same columns as analyze_results with ignis, holding the noiseless values of the
+    spin up probability and of the observables, so corrected and uncorrected columns agree
+    """
+    if observables is None:
+        observables = [GAUSS_LAW, SECTOR_2, GAUSS_LAW_SQUARED]
+
+    result_key = get_all_spin_up_state(number_links)
+    gauss_key = get_gauss_base_state(number_links)
+    probabilities = exact_probabilities(gauge_group, number_links, time_vector, g, control_qubit)
+    weights = get_observable_weights(observables, number_links + 1, control_qubit, gauss_key)
+    observable_values = evaluate_observables(probabilities, weights, shots=1)
+
+    results = {'replica': np.zeros(len(time_vector)), 'time': np.asarray(time_vector, dtype=float)}
+    for name in weights.keys():
+        results[name] = observable_values[name]
+        results[name + '_corrected'] = observable_values[name]
+
+    spin_up = probabilities[:, state_index(result_key)]
+    results['original'] = spin_up
+    results['output_corrected'] = spin_up
+
+    return pd.DataFrame(results)
+
+
+def lattice_probabilities(lattice: Lattice, gauge_group: str, time_vector: List[float], g: float = 1.0) -> np.ndarray:
+    """
+    Returns a (time steps x 2^number_links) array with the exact probability of every link state, starting from all
+    links in state 0. Small lattices are diagonalized, larger ones are evolved with sparse matrix exponentials
+    """
+    hamiltonian = lattice_hamiltonian(lattice, gauge_group, g)
+    initial_state = np.zeros(2 ** lattice.number_links, dtype=complex)
+    initial_state[0] = 1.0
+    time_vector = np.asarray(time_vector, dtype=float)
+
+    if lattice.number_links <= DENSE_LATTICE_LINKS:
+        energies, eigenvectors = np.linalg.eigh(hamiltonian.toarray())
+        phases = np.exp(-1j * np.outer(time_vector, energies))
+        amplitudes = (phases * (eigenvectors.conj().T @ initial_state)) @ eigenvectors.T
+        return np.abs(amplitudes) ** 2
+
+    order = np.argsort(time_vector)
+    amplitudes = np.zeros((len(time_vector), len(initial_state)), dtype=complex)
+    state, current_time = initial_state, 0.0
+    for time_ind in order:
+        state = expm_multiply(-1j * (time_vector[time_ind] - current_time) * hamiltonian, state)
+        amplitudes[time_ind], current_time = state, time_vector[time_ind]
+
+    return np.abs(amplitudes) ** 2
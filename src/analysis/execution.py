@@ -0,0 +1,156 @@
+import asyncio
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass, replace
+from typing import AsyncIterator, List, Optional, TYPE_CHECKING
+
+from qiskit import QuantumCircuit, execute
+from qiskit.result import Result
+
+from src.analysis import instrumentation
+from src.analysis.analysis import (PhysicalModel, ExperimentConfiguration, RunConfiguration, build_template_circuit,
+                                   peephole_optimize, prepare_template, build_circuits, submit_circuits,
+                                   build_run_circuits)
+from src.analysis.transpilation_cache import TranspilationCache
+
+if TYPE_CHECKING:
+    from qiskit.providers.ibmq import IBMQBackend
+
+
+class CircuitExecutor(ABC):
+    """
+    Interface of the backends the experiment pipeline can run on. Implementations provide the blocking execute method
+    and get the asynchronous run method for free
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @abstractmethod
+    def execute(self, circuits: List[QuantumCircuit], shots: int, optimization_level: Optional[int]) -> Result:
+        pass
+
+    async def run(self, circuits: List[QuantumCircuit], shots: int, optimization_level: Optional[int]) -> Result:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.execute, circuits, shots, optimization_level)
+
+
+class IBMQExecutor(CircuitExecutor):
+    def __init__(self, backend: 'IBMQBackend'):
+        from qiskit.providers.ibmq import IBMQJobManager
+
+        super().__init__(backend)
+        self.job_manager = IBMQJobManager()
+        self.job_set_ids = list()
+
+    def execute(self, circuits: List[QuantumCircuit], shots: int, optimization_level: Optional[int]) -> Result:
+        with instrumentation.span('submit', circuits=len(circuits), shots=shots):
+            job_set = submit_circuits(self.job_manager, circuits, self.backend, shots, optimization_level)
+        self.job_set_ids.append(job_set.job_set_id())
+
+        with instrumentation.span('queue_and_execution', job_set_id=job_set.job_set_id()):
+            managed_results = job_set.results()
+        with instrumentation.span('retrieve_results'):
+            return managed_results.combine_results()
+
+
+class AerExecutor(CircuitExecutor):
+    """
+    Runs the circuits on the local qiskit-aer simulator, so the pipeline can run and be benchmarked offline. All
+    circuits of a call are executed as a single batch, experiments in parallel over every core by default
+    """
+
+    def __init__(self, backend=None, seed: Optional[int] = None, max_parallel_threads: int = 0,
+                 max_parallel_experiments: int = 0):
+        if backend is None:
+            from qiskit.providers.aer import QasmSimulator
+            backend = QasmSimulator()
+
+        super().__init__(backend)
+        self.seed = seed
+        self.run_options = {'max_parallel_threads': max_parallel_threads,
+                            'max_parallel_experiments': max_parallel_experiments}
+
+    @classmethod
+    def from_snapshot(cls, snapshot_file: str, seed: Optional[int] = None, **run_options):
+        """
+        Returns an executor simulating the noise of the device saved with save_backend_snapshot, without network
+        """
+        from src.analysis.noise_snapshot import get_noisy_simulator
+
+        return cls(get_noisy_simulator(snapshot_file), seed=seed, **run_options)
+
+    def execute(self, circuits: List[QuantumCircuit], shots: int, optimization_level: Optional[int]) -> Result:
+        optimization_level = 0 if optimization_level is not None else None
+        with instrumentation.span('execute_local', circuits=len(circuits), shots=shots):
+            return execute(circuits, backend=self.backend, shots=shots, optimization_level=optimization_level,
+                           seed_simulator=self.seed, **self.run_options).result()
+
+
+def simulate_circuits(physical_model: PhysicalModel, experiment_config: ExperimentConfiguration,
+                      run_config: RunConfiguration, executor: Optional[AerExecutor] = None) -> \
+        (Result, List[QuantumCircuit]):
+    """
+    Local counterpart of run_circuits. The circuits are transpiled for the simulator of the executor, which is the
+    backend of the run configuration when not given, and every time step is run in the same batch. The result can be
+    passed to analyze_results as it is
+    """
+    if executor is None:
+        executor = AerExecutor(run_config.backend)
+    run_config = replace(run_config, backend=executor.backend)
+
+    circuits = build_run_circuits(physical_model, experiment_config, run_config)
+    result = executor.execute(circuits, run_config.shots, experiment_config.optimisation_level)
+
+    return result, circuits
+
+
+@dataclass
+class BatchResult:
+    batch_index: int
+    time_vector: List[float]
+    circuits: List[QuantumCircuit]
+    result: Result
+
+
+async def run_circuits_async(physical_model: PhysicalModel, experiment_config: ExperimentConfiguration,
+                             run_config: RunConfiguration, executor: CircuitExecutor, batch_size: int = 10,
+                             max_in_flight: int = 2) -> AsyncIterator[BatchResult]:
+    """
+    Runs the experiment in batches of time steps, building the circuits of the next batch while the current ones
+    execute, and yields every batch in order as soon as its results are available. Each batch holds its circuits for
+    all replicas, ordered as get_exp_params expects for the batch's own time vector
+    """
+    loop = asyncio.get_running_loop()
+    optimization_level = experiment_config.optimisation_level
+    zne_extrapolation = experiment_config.zne_extrapolation
+    scale_factors = experiment_config.scale_factors
+    num_replicas = experiment_config.num_replicas
+    cache = TranspilationCache.from_config(experiment_config)
+    transpiled = zne_extrapolation or optimization_level is not None
+
+    template = await loop.run_in_executor(None, build_template_circuit, physical_model)
+    if experiment_config.peephole_optimization:
+        template = await loop.run_in_executor(None, peephole_optimize, template)
+    template = await loop.run_in_executor(None, prepare_template, template, zne_extrapolation, executor.backend,
+                                          optimization_level, cache, experiment_config.seed_transpiler)
+
+    def build_batch(batch_times: List[float]) -> List[QuantumCircuit]:
+        return build_circuits(template, batch_times, zne_extrapolation, scale_factors, transpiled) * num_replicas
+
+    time_vector = list(run_config.time_vector)
+    batches = [time_vector[start:start + batch_size] for start in range(0, len(time_vector), batch_size)]
+    in_flight = deque()
+    next_circuits = loop.run_in_executor(None, build_batch, batches[0]) if batches else None
+
+    for batch_index, batch_times in enumerate(batches):
+        circuits = await next_circuits
+        if batch_index + 1 < len(batches):
+            next_circuits = loop.run_in_executor(None, build_batch, batches[batch_index + 1])
+
+        execution = asyncio.ensure_future(executor.run(circuits, run_config.shots, optimization_level))
+        in_flight.append((batch_index, batch_times, circuits, execution))
+
+        while in_flight and (len(in_flight) >= max_in_flight or batch_index + 1 == len(batches)):
+            finished_index, finished_times, finished_circuits, finished_execution = in_flight.popleft()
+            yield BatchResult(finished_index, finished_times, finished_circuits, await finished_execution)
@@ -0,0 +1,55 @@
+from typing import List
+
+import numpy as np
+from qiskit import QuantumCircuit
+from qiskit.circuit import Gate
+
+from src.analysis.constants import FOLDING_SEED
+
+
+def fold_gates(circuit: QuantumCircuit, scale_factors: List[float], seed: int = FOLDING_SEED) -> List[QuantumCircuit]:
+    """
+    Returns the circuit folded at every scale factor, replacing gates G by G G^-1 G. As with unit fidelities for single
+    qubit gates, only multi qubit gates are folded: every one of them is folded (scale - 1) // 2 times and the
+    remaining fraction is drawn from a single seeded permutation, so larger scale factors fold a superset of the gates
+    folded at smaller ones. Parameters are kept, so a template folded once can be bound to every time step
+    """
+    foldable = np.array([index for index, (instruction, _, cargs) in enumerate(circuit.data)
+                         if is_foldable(instruction, cargs)], dtype=int)
+    order = np.random.default_rng(seed).permutation(len(foldable))
+
+    return [fold_circuit(circuit, foldable, order, scale_factor) for scale_factor in scale_factors]
+
+
+def is_foldable(instruction, cargs: list) -> bool:
+    return isinstance(instruction, Gate) and instruction.num_qubits > 1 and not cargs and instruction.condition is None
+
+
+def get_fold_counts(number_foldable: int, scale_factor: float) -> (int, int):
+    """
+    Returns the number of times every foldable gate is folded and the number of gates folded once more
+    """
+    if scale_factor < 1:
+        raise ValueError("Scale factors must be greater than or equal to 1")
+
+    uniform_folds, fraction = divmod((scale_factor - 1) / 2, 1)
+    return int(uniform_folds), int(round(fraction * number_foldable))
+
+
+def fold_circuit(circuit: QuantumCircuit, foldable: np.ndarray, order: np.ndarray,
+                 scale_factor: float) -> QuantumCircuit:
+    uniform_folds, partial_folds = get_fold_counts(len(foldable), scale_factor)
+    folds = np.zeros(len(circuit.data), dtype=int)
+    folds[foldable] = uniform_folds
+    folds[foldable[order[:partial_folds]]] += 1
+
+    data = list()
+    for (instruction, qargs, cargs), number_folds in zip(circuit.data, folds):
+        data.append((instruction, qargs, cargs))
+        for _ in range(number_folds):
+            data.append((instruction.inverse(), qargs, cargs))
+            data.append((instruction.copy(), qargs, cargs))
+
+    folded = circuit.copy()
+    folded.data = data
+    return folded
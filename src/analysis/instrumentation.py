@@ -0,0 +1,172 @@
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import List, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from qiskit import QuantumCircuit
+
+
+class Tracer(ABC):
+    """
+    Receives the timing spans and counters of the pipeline. Subclasses decide where they go
+    """
+
+    @abstractmethod
+    def record(self, name: str, start: float, duration: float, attributes: dict):
+        pass
+
+    def count(self, name: str, value: float, attributes: dict):
+        pass
+
+
+class LoggingTracer(Tracer):
+    def __init__(self, logger: Optional[logging.Logger] = None, level: int = logging.INFO):
+        self.logger = logger or logging.getLogger('plaquette_models')
+        self.level = level
+
+    def record(self, name: str, start: float, duration: float, attributes: dict):
+        self.logger.log(self.level, '%s took %.4f s %s', name, duration, attributes or '')
+
+    def count(self, name: str, value: float, attributes: dict):
+        self.logger.log(self.level, '%s = %s %s', name, value, attributes or '')
+
+
+class JsonTraceTracer(Tracer):
+    """
+    Collects the spans as trace events that can be opened with chrome://tracing or Perfetto
+    """
+
+    def __init__(self):
+        self.events = list()
+        self.origin = time.perf_counter()
+
+    def record(self, name: str, start: float, duration: float, attributes: dict):
+        self.events.append({'name': name, 'ph': 'X', 'ts': (start - self.origin) * 1e6, 'dur': duration * 1e6,
+                            'pid': os.getpid(), 'tid': threading.get_ident(), 'args': attributes})
+
+    def count(self, name: str, value: float, attributes: dict):
+        self.events.append({'name': name, 'ph': 'C', 'ts': (time.perf_counter() - self.origin) * 1e6,
+                            'pid': os.getpid(), 'args': dict(attributes, value=value)})
+
+    def save(self, filename: str):
+        with open(filename, 'w') as file:
+            json.dump({'traceEvents': self.events}, file, default=str)
+
+
+class ProfileTracer(Tracer):
+    """
+    Aggregates the number of calls and the total time of every span, as a cProfile report does for functions
+    """
+
+    def __init__(self):
+        self.calls = Counter()
+        self.total_time = defaultdict(float)
+        self.counters = defaultdict(float)
+
+    def record(self, name: str, start: float, duration: float, attributes: dict):
+        self.calls[name] += 1
+        self.total_time[name] += duration
+
+    def count(self, name: str, value: float, attributes: dict):
+        self.counters[name] += value
+
+    def report(self) -> str:
+        lines = [f"{'ncalls':>8} {'tottime':>10} {'percall':>10}  span"]
+        for name, total_time in sorted(self.total_time.items(), key=lambda item: -item[1]):
+            calls = self.calls[name]
+            lines.append(f'{calls:8d} {total_time:10.4f} {total_time / calls:10.4f}  {name}')
+        lines.extend(f'{value:>30}  {name}' for name, value in sorted(self.counters.items()))
+        return '\n'.join(lines)
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'attributes', 'start')
+
+    def __init__(self, tracer: Tracer, name: str, attributes: dict):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.record(self.name, self.start, time.perf_counter() - self.start, self.attributes)
+        return False
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+_NULL_SPAN = _NullSpan()
+_tracer: Optional[Tracer] = None
+
+
+def set_tracer(tracer: Optional[Tracer]):
+    global _tracer
+    _tracer = tracer
+
+
+def enabled() -> bool:
+    return _tracer is not None
+
+
+@contextmanager
+def tracing(tracer: Tracer):
+    previous_tracer = _tracer
+    set_tracer(tracer)
+    try:
+        yield tracer
+    finally:
+        set_tracer(previous_tracer)
+
+
+def span(name: str, **attributes):
+    """
+    Returns a context manager timing the enclosed block, which does nothing unless a tracer is set
+    """
+    if _tracer is None:
+        return _NULL_SPAN
+
+    return _Span(_tracer, name, attributes)
+
+
+def count(name: str, value: float = 1, **attributes):
+    if _tracer is not None:
+        _tracer.count(name, value, attributes)
+
+
+def circuit_stats(circuits: List['QuantumCircuit']) -> dict:
+    """
+    Returns the number of circuits, their maximum depth and their total gate counts. Only meant to be called when
+    tracing is enabled, since it walks every circuit
+    """
+    operations = Counter()
+    for circuit in circuits:
+        operations.update(circuit.count_ops())
+
+    return {
+        'circuits': len(circuits),
+        'max_depth': max((circuit.depth() for circuit in circuits), default=0),
+        'gates': sum(operations.values()),
+        'operations': dict(operations),
+    }
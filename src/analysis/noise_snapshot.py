@@ -0,0 +1,61 @@
+import json
+from datetime import datetime
+
+from qiskit.providers.aer import QasmSimulator
+from qiskit.providers.aer.noise import NoiseModel
+from qiskit.providers.models import BackendProperties, QasmBackendConfiguration
+from qiskit.test.mock.fake_backend import FakeBackend
+
+from src.analysis.constants import SNAPSHOT_CONFIGURATION, SNAPSHOT_PROPERTIES
+
+
+class SnapshotBackend(FakeBackend):
+    """
+    Offline copy of a device with the configuration and calibrated properties saved by save_backend_snapshot. Its
+    coupling map, basis gates and error rates are the ones of the device at the time of the snapshot
+    """
+
+    def __init__(self, snapshot: dict):
+        super().__init__(QasmBackendConfiguration.from_dict(snapshot[SNAPSHOT_CONFIGURATION]))
+        self._properties = BackendProperties.from_dict(snapshot[SNAPSHOT_PROPERTIES])
+
+    def properties(self) -> BackendProperties:
+        return self._properties
+
+    @classmethod
+    def load(cls, filename: str):
+        with open(filename, 'r') as file:
+            return cls(json.load(file))
+
+
+def save_backend_snapshot(backend, filename: str):
+    """
+    Saves the configuration and the latest calibrated properties of a backend, so it can be simulated without network
+    """
+    snapshot = {
+        SNAPSHOT_CONFIGURATION: backend.configuration().to_dict(),
+        SNAPSHOT_PROPERTIES: backend.properties().to_dict(),
+    }
+    with open(filename, 'w') as file:
+        json.dump(snapshot, file, default=serialize)
+
+
+def serialize(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, complex):
+        return [value.real, value.imag]
+
+    return str(value)
+
+
+def get_noisy_simulator(snapshot_file: str) -> QasmSimulator:
+    """
+    Returns an Aer simulator with the coupling map, basis gates and noise model (gate, readout and thermal relaxation
+    errors) of the device in the snapshot
+    """
+    return QasmSimulator.from_backend(SnapshotBackend.load(snapshot_file))
+
+
+def get_noise_model(snapshot_file: str) -> NoiseModel:
+    return NoiseModel.from_backend(SnapshotBackend.load(snapshot_file))
@@ -0,0 +1,208 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from qiskit import QuantumCircuit, ClassicalRegister, QuantumRegister
+
+from src.analysis import instrumentation
+from src.analysis.analysis import (PhysicalModel, ExperimentConfiguration, RunConfiguration, build_template_circuit,
+                                   peephole_optimize, transpile_circuit, bind_time_steps, submit_circuits)
+from src.analysis.constants import FOLDING_SEED
+from src.analysis.error_mitigation import get_exp_params
+from src.analysis.folding import fold_gates
+from src.analysis.transpilation_cache import TranspilationCache
+from src.observables.engine import state_index
+
+if TYPE_CHECKING:
+    from qiskit.providers.ibmq import IBMQJobManager, IBMQBackend
+
+
+@dataclass
+class Packing:
+    """
+    Experiments, ordered as the rows of get_exp_params, placed on the physical qubits of the layouts: experiment i runs
+    in circuit i // len(layouts) on layout i % len(layouts), measured into its own block of classical bits
+    """
+    layouts: List[List[int]]
+    n_qubits: int
+    experiments: int
+
+    @property
+    def num_circuits(self) -> int:
+        return -(-self.experiments // len(self.layouts))
+
+    def get_position(self, exp_ind: int) -> (int, int):
+        return divmod(exp_ind, len(self.layouts))
+
+
+class PackedResult:
+    """
+    Presents the result of packed circuits as one experiment per plaquette instance, with the marginal counts of its
+    classical bits, so it can be analyzed as the result of run_circuits
+    """
+
+    def __init__(self, result, packing: Packing):
+        self.result = result
+        self.packing = packing
+        self._marginals = dict()
+
+    def get_counts(self, exp_ind: int) -> dict:
+        circuit_ind, slot = self.packing.get_position(exp_ind)
+        if circuit_ind not in self._marginals:
+            self._marginals[circuit_ind] = demultiplex_counts(self.result.get_counts(circuit_ind), self.packing)
+
+        return self._marginals[circuit_ind][slot]
+
+
+def demultiplex_counts(counts: dict, packing: Packing) -> List[dict]:
+    """
+    Returns the marginal counts of every layout, where the bits of layout j are the j-th block of n_qubits bits
+    counting from the right
+    """
+    n_qubits = packing.n_qubits
+    mask = 2 ** n_qubits - 1
+    marginals = [defaultdict(int) for _ in packing.layouts]
+    for state, count in counts.items():
+        value = state_index(state)
+        for slot, marginal in enumerate(marginals):
+            marginal[format((value >> (slot * n_qubits)) & mask, f'0{n_qubits}b')] += count
+
+    return [dict(marginal) for marginal in marginals]
+
+
+def get_cx_errors(properties) -> Dict[Tuple[int, int], float]:
+    errors = dict()
+    if properties is None:
+        return errors
+
+    for gate in properties.gates:
+        if gate.gate == 'cx':
+            errors[tuple(gate.qubits)] = next(
+                (parameter.value for parameter in gate.parameters if parameter.name == 'gate_error'), 0.0)
+
+    return errors
+
+
+def find_qubit_layouts(coupling_map: List[List[int]], n_qubits: int, max_layouts: Optional[int] = None,
+                       cx_errors: Optional[Dict[Tuple[int, int], float]] = None) -> List[List[int]]:
+    """
+    Returns disjoint sets of n_qubits connected physical qubits. Candidate sets are grown from every qubit by adding the
+    neighbour with most links into the set, and the sets with most internal links and lowest mean cx error are picked
+    first
+    """
+    cx_errors = cx_errors or dict()
+    neighbours = defaultdict(set)
+    for first, second in coupling_map:
+        neighbours[first].add(second)
+        neighbours[second].add(first)
+
+    def link_error(qubit: int, subset: List[int]) -> float:
+        errors = [cx_errors.get((qubit, other), cx_errors.get((other, qubit), 0.0)) for other in subset
+                  if other in neighbours[qubit]]
+        return sum(errors) / len(errors) if errors else 0.0
+
+    def score(subset: List[int]) -> tuple:
+        links = [(first, second) for first in subset for second in neighbours[first] & set(subset) if first < second]
+        errors = [cx_errors.get(link, cx_errors.get(link[::-1], 0.0)) for link in links]
+        return len(links), -sum(errors) / max(len(errors), 1)
+
+    candidates = list()
+    for start in sorted(neighbours):
+        subset = [start]
+        while len(subset) < n_qubits:
+            frontier = {qubit for member in subset for qubit in neighbours[member]} - set(subset)
+            if not frontier:
+                break
+            subset.append(max(sorted(frontier), key=lambda qubit: (len(neighbours[qubit] & set(subset)),
+                                                                    -link_error(qubit, subset))))
+        if len(subset) == n_qubits:
+            candidates.append(subset)
+
+    layouts = list()
+    used = set()
+    for subset in sorted(candidates, key=score, reverse=True):
+        if used.isdisjoint(subset):
+            layouts.append(subset)
+            used.update(subset)
+        if max_layouts is not None and len(layouts) == max_layouts:
+            break
+
+    return layouts
+
+
+def build_packed_circuits(physical_model: PhysicalModel, experiment_config: ExperimentConfiguration,
+                          run_config: RunConfiguration, max_layouts: Optional[int] = None) -> \
+        (List[QuantumCircuit], Packing):
+    """
+    Returns the packed circuits of every replica, time step and scale factor. The template is transpiled once for the
+    coupling map restricted to every layout, so routing never leaves the layout, and each experiment is bound on the
+    template of its layout before being placed on its physical qubits
+    """
+    backend = run_config.backend
+    zne_extrapolation = experiment_config.zne_extrapolation
+    scale_factors = experiment_config.scale_factors
+    cache = TranspilationCache.from_config(experiment_config)
+
+    with instrumentation.span('build_template'):
+        template = build_template_circuit(physical_model)
+    if experiment_config.peephole_optimization:
+        template = peephole_optimize(template)
+
+    layouts = find_qubit_layouts(backend.configuration().coupling_map, template.num_qubits, max_layouts,
+                                 get_cx_errors(backend.properties()))
+    if not layouts:
+        raise ValueError(f"The backend has no set of {template.num_qubits} connected qubits")
+
+    layout_templates = list()
+    for layout in layouts:
+        layout_template = transpile_circuit(template, backend, experiment_config.optimisation_level, cache=cache,
+                                            seed=experiment_config.seed_transpiler, layout=layout)
+        if zne_extrapolation:
+            with instrumentation.span('fold', circuits=len(scale_factors)):
+                layout_templates.append(dict(zip(scale_factors, fold_gates(layout_template, scale_factors,
+                                                                           seed=FOLDING_SEED))))
+        else:
+            layout_templates.append({None: layout_template})
+
+    experiments_params = get_exp_params(run_config.time_vector, zne_extrapolation, scale_factors,
+                                        experiment_config.num_replicas)
+    packing = Packing(layouts, template.num_qubits, len(experiments_params))
+    bound_circuits = dict()
+    packed_circuits = [new_packed_circuit(backend, packing) for _ in range(packing.num_circuits)]
+
+    with instrumentation.span('pack', experiments=packing.experiments, circuits=packing.num_circuits):
+        for exp_ind, params in enumerate(experiments_params):
+            circuit_ind, slot = packing.get_position(exp_ind)
+            key = (slot, params[0], params[1] if zne_extrapolation else None)
+            if key not in bound_circuits:
+                bound_circuits[key] = bind_time_steps(layout_templates[slot][key[2]], [key[1]],
+                                                      merge_rotations=True)[0]
+            circuit = bound_circuits[key]
+            clbits = range(slot * packing.n_qubits, (slot + 1) * packing.n_qubits)
+            packed_circuits[circuit_ind].compose(circuit, qubits=layouts[slot], clbits=list(clbits), inplace=True)
+
+    return packed_circuits, packing
+
+
+def new_packed_circuit(backend: 'IBMQBackend', packing: Packing) -> QuantumCircuit:
+    return QuantumCircuit(QuantumRegister(backend.configuration().n_qubits, 'q'),
+                          ClassicalRegister(len(packing.layouts) * packing.n_qubits, 'c'))
+
+
+def run_packed_circuits(physical_model: PhysicalModel, experiment_config: ExperimentConfiguration,
+                        run_config: RunConfiguration, max_layouts: Optional[int] = None) -> \
+        ('IBMQJobManager', str, Packing):
+    """
+    Same as run_circuits with several plaquette instances side by side on disjoint qubits of the device. The results
+    of the job set are analyzed by wrapping them in a PackedResult with the returned packing
+    """
+    from qiskit.providers.ibmq import IBMQJobManager
+
+    backend = run_config.backend
+    circuits, packing = build_packed_circuits(physical_model, experiment_config, run_config, max_layouts)
+    job_manager = IBMQJobManager()
+    with instrumentation.span('submit', circuits=len(circuits), shots=run_config.shots):
+        job_set = submit_circuits(job_manager, circuits, backend, run_config.shots,
+                                  experiment_config.optimisation_level)
+
+    return job_manager, job_set.job_set_id(), packing
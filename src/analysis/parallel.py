@@ -0,0 +1,22 @@
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import nullcontext
+from typing import Optional
+
+
+def get_executor(max_workers: Optional[int]):
+    if not max_workers:
+        return nullcontext()
+
+    return ProcessPoolExecutor(max_workers=max_workers)
+
+
+def map_in_executor(function, *iterables, executor: Optional[Executor] = None) -> list:
+    """
+    Maps function over the iterables, in the calling process when there is no executor. Results keep the input order
+    """
+    if executor is None:
+        return list(map(function, *iterables))
+
+    chunk_size = max(1, len(iterables[0]) // (4 * (os.cpu_count() or 1)))
+    return list(executor.map(function, *iterables, chunksize=chunk_size))
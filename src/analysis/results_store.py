@@ -0,0 +1,180 @@
+import json
+import os
+from dataclasses import dataclass, field
+from typing import List, Optional, TYPE_CHECKING
+
+import numpy as np
+import pandas as pd
+
+from src.analysis.constants import MATRIX, STATES, MATRICES, CLUSTERS, CAL_MATRIX, STATE_LABELS
+from src.observables.engine import counts_to_array
+
+if TYPE_CHECKING:
+    from qiskit.result import Result
+
+COUNTS = 'counts'
+TIME = 'time'
+SCALE_FACTOR = 'scale_factor'
+REPLICA = 'replica'
+BACKEND = 'backend'
+METADATA_FILE = 'metadata.json'
+CALIBRATION_FILE = 'calibration.npz'
+TABLES_DIRECTORY = 'tables'
+
+
+@dataclass
+class StoredRun:
+    counts: np.ndarray
+    time: np.ndarray
+    scale_factor: np.ndarray
+    replica: np.ndarray
+    backend: np.ndarray
+    metadata: dict = field(default_factory=dict)
+
+    @property
+    def experiments_params(self) -> np.ndarray:
+        """
+        Returns the rows of get_exp_params matching the stored experiments
+        """
+        if self.metadata.get('zne_extrapolation'):
+            return np.stack([self.time, self.scale_factor, self.replica], axis=1)
+
+        return np.stack([self.time, self.replica], axis=1)
+
+    def get_counts(self, exp_ind: int) -> dict:
+        """
+        Returns the counts of an experiment as a qiskit Result would, so a stored run can be analyzed as it is
+        """
+        n_qubits = self.counts.shape[1].bit_length() - 1
+        experiment_counts = self.counts[exp_ind]
+        return {format(state, f'0{n_qubits}b'): int(experiment_counts[state])
+                for state in np.flatnonzero(experiment_counts)}
+
+
+class ResultsStore:
+    """
+    Stores every run in its own directory, counts as a dense uint32 array with one row per experiment and a column per
+    bitstring, and metadata as one column per field. Arrays are saved as npy files so they can be memory-mapped
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _run_directory(self, run_id: str) -> str:
+        return os.path.join(self.directory, run_id)
+
+    def runs(self) -> List[str]:
+        return sorted(run_id for run_id in os.listdir(self.directory)
+                      if os.path.exists(os.path.join(self._run_directory(run_id), METADATA_FILE)))
+
+    def save_run(self, run_id: str, counts_array: np.ndarray, experiments_params: np.ndarray, zne_extrapolation: bool,
+                 backend_name: str, metadata: Optional[dict] = None):
+        run_directory = self._run_directory(run_id)
+        os.makedirs(run_directory, exist_ok=True)
+
+        number_experiments = len(counts_array)
+        columns = {
+            COUNTS: np.asarray(counts_array).round().astype(np.uint32),
+            TIME: experiments_params[:, 0].astype(float),
+            SCALE_FACTOR: experiments_params[:, 1].astype(float) if zne_extrapolation else np.ones(number_experiments),
+            REPLICA: experiments_params[:, -1].astype(np.int64),
+            BACKEND: np.full(number_experiments, backend_name),
+        }
+        for name, column in columns.items():
+            np.save(os.path.join(run_directory, name + '.npy'), column)
+
+        metadata = dict(metadata or {})
+        metadata.update({'zne_extrapolation': zne_extrapolation, 'backend': backend_name,
+                         'n_qubits': int(counts_array.shape[1]).bit_length() - 1})
+        with open(os.path.join(run_directory, METADATA_FILE), 'w') as file:
+            json.dump(metadata, file, default=str)
+
+    def save_result(self, run_id: str, result_hpc: 'Result', experiments_params: np.ndarray, n_qubits: int,
+                    zne_extrapolation: bool, backend_name: str, metadata: Optional[dict] = None):
+        counts_list = [result_hpc.get_counts(exp_ind) for exp_ind in range(len(experiments_params))]
+        self.save_run(run_id, counts_to_array(counts_list, n_qubits), experiments_params, zne_extrapolation,
+                      backend_name, metadata)
+
+    def load_run(self, run_id: str, mmap: bool = True) -> StoredRun:
+        run_directory = self._run_directory(run_id)
+        mmap_mode = 'r' if mmap else None
+        columns = {name: np.load(os.path.join(run_directory, name + '.npy'), mmap_mode=mmap_mode)
+                   for name in (COUNTS, TIME, SCALE_FACTOR, REPLICA, BACKEND)}
+        with open(os.path.join(run_directory, METADATA_FILE), 'r') as file:
+            metadata = json.load(file)
+
+        return StoredRun(metadata=metadata, **columns)
+
+    def save_calibration(self, run_id: str, error_correction: Optional[dict] = None, meas_filter=None):
+        """
+        Stores a custom or tensored calibration dict, or the calibration matrix of an ignis filter, next to a run
+        """
+        run_directory = self._run_directory(run_id)
+        os.makedirs(run_directory, exist_ok=True)
+        np.savez(os.path.join(run_directory, CALIBRATION_FILE), **get_calibration_arrays(error_correction, meas_filter))
+
+    def load_calibration(self, run_id: str) -> dict:
+        """
+        Returns the stored calibration arrays, with custom and tensored calibrations in the format get_counts_result
+        expects
+        """
+        path = os.path.join(self._run_directory(run_id), CALIBRATION_FILE)
+        if not os.path.exists(path):
+            return dict()
+
+        with np.load(path) as arrays:
+            return read_calibration_arrays(arrays)
+
+    def save_table(self, run_id: str, name: str, table: pd.DataFrame):
+        table_directory = os.path.join(self._run_directory(run_id), TABLES_DIRECTORY, name)
+        os.makedirs(table_directory, exist_ok=True)
+        for column_ind, column in enumerate(table.columns):
+            values = table[column].to_numpy()
+            if values.dtype == object:
+                values = values.astype(str)  # Fixed width unicode, object arrays can not be memory-mapped
+            np.save(os.path.join(table_directory, f'{column_ind}_{column}.npy'), values)
+
+    def load_table(self, run_id: str, name: str, mmap: bool = True) -> pd.DataFrame:
+        table_directory = os.path.join(self._run_directory(run_id), TABLES_DIRECTORY, name)
+        filenames = sorted(os.listdir(table_directory), key=lambda filename: int(filename.split('_', 1)[0]))
+        mmap_mode = 'r' if mmap else None
+
+        return pd.DataFrame({filename.split('_', 1)[1][:-len('.npy')]:
+                             np.load(os.path.join(table_directory, filename), mmap_mode=mmap_mode)
+                             for filename in filenames})
+
+
+def get_calibration_arrays(error_correction: Optional[dict] = None, meas_filter=None) -> dict:
+    """
+    Returns the arrays of a custom or tensored calibration dict, or of the calibration matrix of an ignis filter
+    """
+    arrays = dict()
+    if meas_filter is not None:
+        arrays[CAL_MATRIX] = np.asarray(meas_filter.cal_matrix)
+        arrays[STATE_LABELS] = np.asarray(meas_filter.state_labels)
+    if error_correction is not None and MATRIX in error_correction:
+        arrays[MATRIX] = np.asarray(error_correction[MATRIX])
+        arrays[STATES] = np.asarray(error_correction[STATES])
+    if error_correction is not None and CLUSTERS in error_correction:
+        for ind, (cluster, matrix) in enumerate(zip(error_correction[CLUSTERS], error_correction[MATRICES])):
+            arrays[f'{CLUSTERS}_{ind}'] = np.asarray(cluster)
+            arrays[f'{MATRICES}_{ind}'] = np.asarray(matrix)
+
+    return arrays
+
+
+def read_calibration_arrays(arrays) -> dict:
+    """
+    Inverse of get_calibration_arrays for the arrays of an npz file
+    """
+    calibration = {name: arrays[name] for name in arrays.files}
+
+    number_clusters = sum(name.startswith(CLUSTERS + '_') for name in calibration)
+    if number_clusters:
+        calibration[CLUSTERS] = [calibration.pop(f'{CLUSTERS}_{ind}').tolist() for ind in range(number_clusters)]
+        calibration[MATRICES] = [calibration.pop(f'{MATRICES}_{ind}') for ind in range(number_clusters)]
+    if STATES in calibration:
+        calibration[STATES] = calibration[STATES].tolist()
+
+    return calibration
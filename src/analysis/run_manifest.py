@@ -0,0 +1,215 @@
+import json
+import os
+import uuid
+from dataclasses import asdict
+from typing import List, Optional, TYPE_CHECKING
+
+import numpy as np
+import pandas as pd
+from qiskit import QuantumCircuit
+from qiskit.circuit import qpy_serialization
+
+from src.analysis import instrumentation
+from src.analysis.analysis import (PhysicalModel, ExperimentConfiguration, RunConfiguration, build_run_circuits,
+                                   submit_circuits, analyze_results)
+from src.analysis.error_mitigation import get_exp_params
+from src.analysis.results_store import ResultsStore, StoredRun
+from src.models import circuits as models
+from src.models.lattice import Lattice
+
+if TYPE_CHECKING:
+    from qiskit.providers.ibmq import IBMQJobManager
+
+MANIFEST_FILE = 'manifest.json'
+CIRCUITS_FILE = 'circuits.qpy'
+RESULTS_DIRECTORY = 'results'
+REPLAY_RUN = 'replay'
+
+
+class RunManifest:
+    """
+    Everything needed to resume a run from its directory: the configuration of the experiment (without the backend
+    handle), the compiled circuits as QPY, the submitted job sets and the results and analyses already retrieved.
+    Results are kept in a ResultsStore with one run per job set
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.store = ResultsStore(os.path.join(directory, RESULTS_DIRECTORY))
+        with open(os.path.join(directory, MANIFEST_FILE), 'r') as file:
+            self.manifest = json.load(file)
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        return os.path.exists(os.path.join(directory, MANIFEST_FILE))
+
+    @classmethod
+    def create(cls, directory: str, physical_model: PhysicalModel, experiment_config: ExperimentConfiguration,
+               run_config: RunConfiguration, circuits: List[QuantumCircuit]):
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, CIRCUITS_FILE), 'wb') as file:
+            qpy_serialization.dump(circuits, file)
+
+        physical_model_dict = asdict(physical_model)
+        physical_model_dict['plaquette'] = physical_model.plaquette.__name__
+        run_config_dict = {'time_vector': [float(time_step) for time_step in run_config.time_vector],
+                           'shots': run_config.shots}
+        manifest = {
+            'name': f'{os.path.basename(os.path.abspath(directory))}-{uuid.uuid4().hex[:8]}',
+            'backend': run_config.backend.name() if run_config.backend is not None else None,
+            'physical_model': physical_model_dict,
+            'experiment_configuration': asdict(experiment_config),
+            'run_configuration': run_config_dict,
+            'job_set_ids': [],
+            'analyses': [],
+        }
+        write_manifest(directory, manifest)
+
+        return cls(directory)
+
+    @property
+    def name(self) -> str:
+        return self.manifest['name']
+
+    @property
+    def backend_name(self) -> Optional[str]:
+        return self.manifest['backend']
+
+    @property
+    def physical_model(self) -> PhysicalModel:
+        physical_model = dict(self.manifest['physical_model'])
+        physical_model['plaquette'] = getattr(models, physical_model['plaquette'])
+        if physical_model['lattice'] is not None:
+            lattice = physical_model['lattice']
+            physical_model['lattice'] = Lattice(lattice['number_links'],
+                                                [tuple(links) for links in lattice['plaquettes']])
+
+        return PhysicalModel(**physical_model)
+
+    @property
+    def experiment_config(self) -> ExperimentConfiguration:
+        return ExperimentConfiguration(**self.manifest['experiment_configuration'])
+
+    def get_run_config(self, backend=None) -> RunConfiguration:
+        """
+        Returns the run configuration, attached to the given backend since handles are not persisted
+        """
+        return RunConfiguration(backend=backend, **self.manifest['run_configuration'])
+
+    @property
+    def experiments_params(self) -> np.ndarray:
+        experiment_config = self.experiment_config
+        return get_exp_params(self.manifest['run_configuration']['time_vector'], experiment_config.zne_extrapolation,
+                              experiment_config.scale_factors, experiment_config.num_replicas)
+
+    @property
+    def job_set_ids(self) -> List[str]:
+        return list(self.manifest['job_set_ids'])
+
+    def load_circuits(self) -> List[QuantumCircuit]:
+        with open(os.path.join(self.directory, CIRCUITS_FILE), 'rb') as file:
+            return qpy_serialization.load(file)
+
+    def add_job_set(self, job_set_id: str):
+        self.manifest['job_set_ids'].append(job_set_id)
+        write_manifest(self.directory, self.manifest)
+
+    def has_result(self, run_id: str) -> bool:
+        return run_id in self.store.runs()
+
+    def save_result(self, run_id: str, result_hpc):
+        n_qubits = self.load_circuits()[0].num_clbits
+        self.store.save_result(run_id, result_hpc, self.experiments_params, n_qubits,
+                               self.experiment_config.zne_extrapolation, self.backend_name or '',
+                               metadata={'manifest': self.name})
+
+    def load_result(self, run_id: str) -> StoredRun:
+        return self.store.load_run(run_id)
+
+    def has_analysis(self, run_id: str, name: str) -> bool:
+        return [run_id, name] in self.manifest['analyses']
+
+    def save_analysis(self, run_id: str, name: str, table: pd.DataFrame):
+        # The analysis is only recorded once all its columns are written, so a partial table is computed again
+        self.store.save_table(run_id, name, table)
+        self.manifest['analyses'].append([run_id, name])
+        write_manifest(self.directory, self.manifest)
+
+    def load_analysis(self, run_id: str, name: str) -> pd.DataFrame:
+        return self.store.load_table(run_id, name, mmap=False)
+
+
+def write_manifest(directory: str, manifest: dict):
+    path = os.path.join(directory, MANIFEST_FILE)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump(manifest, file, indent=2, default=str)
+    os.replace(temp_path, path)
+
+
+def run_with_manifest(directory: str, physical_model: PhysicalModel, experiment_config: ExperimentConfiguration,
+                      run_config: RunConfiguration) -> RunManifest:
+    """
+    Same as run_circuits, persisting the run in directory before submitting it. When the directory already holds a
+    manifest, its circuits are reused without recompiling and its job set is not submitted again
+    """
+    if RunManifest.exists(directory):
+        manifest = RunManifest(directory)
+    else:
+        circuits = build_run_circuits(physical_model, experiment_config, run_config)
+        manifest = RunManifest.create(directory, physical_model, experiment_config, run_config, circuits)
+
+    if not manifest.job_set_ids:
+        from qiskit.providers.ibmq import IBMQJobManager
+
+        circuits = manifest.load_circuits()
+        with instrumentation.span('submit', circuits=len(circuits), shots=run_config.shots):
+            job_set = submit_circuits(IBMQJobManager(), circuits, run_config.backend, run_config.shots,
+                                      experiment_config.optimisation_level, name=manifest.name)
+        manifest.add_job_set(job_set.job_set_id())
+
+    return manifest
+
+
+def retrieve_results(manifest: RunManifest, provider, job_manager: Optional['IBMQJobManager'] = None) -> StoredRun:
+    """
+    Returns the results of the last job set of the manifest, retrieving and storing them only once
+    """
+    job_set_id = manifest.job_set_ids[-1]
+    if not manifest.has_result(job_set_id):
+        from qiskit.providers.ibmq import IBMQJobManager
+
+        job_set = (job_manager or IBMQJobManager()).retrieve_job_set(job_set_id, provider)
+        with instrumentation.span('retrieve_results', job_set_id=job_set_id):
+            manifest.save_result(job_set_id, job_set.results())
+
+    return manifest.load_result(job_set_id)
+
+
+def replay(manifest: RunManifest, executor) -> StoredRun:
+    """
+    Runs the stored circuits on a local CircuitExecutor, such as an AerExecutor, and stores the result as the replay
+    run of the manifest
+    """
+    if not manifest.has_result(REPLAY_RUN):
+        run_config = manifest.get_run_config(executor.backend)
+        result = executor.execute(manifest.load_circuits(), run_config.shots,
+                                  manifest.experiment_config.optimisation_level)
+        manifest.save_result(REPLAY_RUN, result)
+
+    return manifest.load_result(REPLAY_RUN)
+
+
+def analyze_run(manifest: RunManifest, run_id: str, name: str = 'results', **kwargs) -> pd.DataFrame:
+    """
+    Returns the analyze_results table of a stored run, analyzing it only the first time. Keyword arguments are passed
+    to analyze_results, and name tells apart analyses of the same run with different arguments
+    """
+    if manifest.has_analysis(run_id, name):
+        return manifest.load_analysis(run_id, name)
+
+    results_df = analyze_results(manifest.physical_model, manifest.experiment_config, manifest.get_run_config(),
+                                 manifest.load_result(run_id), **kwargs)
+    manifest.save_analysis(run_id, name, results_df)
+
+    return results_df
@@ -0,0 +1,118 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.analysis.constants import MAX_SHOTS, ZNE_ORDER, ZneMethods
+from src.analysis.zne_extrapolation import get_zne_estimator
+from src.observables.engine import counts_to_array
+
+
+@dataclass
+class ShotAllocation:
+    """
+    Shots of every experiment, ordered as the rows of get_exp_params. The pilot shots are included in the total shots,
+    and the additional ones are run in batches of experiments sharing the same number of shots
+    """
+    pilot_shots: np.ndarray
+    shots: np.ndarray
+    max_shots: int = MAX_SHOTS  # Largest number of shots of a single execution on the backend
+
+    @property
+    def additional_shots(self) -> np.ndarray:
+        return self.shots - self.pilot_shots
+
+    @property
+    def total_shots(self) -> int:
+        return int(self.shots.sum())
+
+    def get_batches(self) -> List[Tuple[int, np.ndarray]]:
+        """
+        Returns the number of shots and the experiments of every batch. Experiments needing more than max_shots
+        additional shots are split over several batches
+        """
+        remaining = self.additional_shots.copy()
+        batches = list()
+        while (remaining > 0).any():
+            chunk = np.minimum(remaining, self.max_shots)
+            for batch_shots in np.unique(chunk[chunk > 0]):
+                batches.append((int(batch_shots), np.flatnonzero(chunk == batch_shots)))
+            remaining -= chunk
+
+        return batches
+
+    def merge_counts(self, counts_array: np.ndarray, batch_results: list) -> np.ndarray:
+        """
+        Adds the counts of the results of every batch, in the order of get_batches, to the pilot counts
+        """
+        merged = np.array(counts_array, dtype=float)
+        n_qubits = counts_array.shape[1].bit_length() - 1
+        for (_, experiments), result in zip(self.get_batches(), batch_results):
+            counts_list = [result.get_counts(batch_ind) for batch_ind in range(len(experiments))]
+            merged[experiments] += counts_to_array(counts_list, n_qubits)
+
+        return merged
+
+
+def allocate_shots(counts_array: np.ndarray, experiments_params: np.ndarray, weights: Dict[str, np.ndarray],
+                   target_error: float, zne_extrapolation: bool, scale_factors: list,
+                   method: str = ZneMethods.POLYNOMIAL, order: int = ZNE_ORDER, asymptote: float = 0.0,
+                   shot_step: Optional[int] = None, max_shots: int = MAX_SHOTS) -> ShotAllocation:
+    """
+    Returns the shots of every experiment so the replica mean of every observable, extrapolated to zero noise if
+    requested, has at most the target standard error with the least total shots. The single shot variance of every
+    (time, scale factor) cell is estimated from the pilot counts of all its replicas, and the shots of a time step are
+    split across scale factors in proportion to |estimator weight| x standard deviation, which minimizes the total for
+    a given error. Each observable asks for its own shots and the largest request wins. Additional shots are rounded
+    up to multiples of shot_step, by default the pilot shots, so they can be run in few batches
+    """
+    pilot_shots = counts_array.sum(axis=1)
+    num_replicas = int(experiments_params[:, -1].max()) + 1
+    cells, cell_ind = np.unique(experiments_params[:, :-1], axis=0, return_inverse=True)
+    cell_ind = cell_ind.ravel()
+
+    # Pooled replica counts, with half a count added to every state so unseen states do not give zero variance
+    cell_counts = np.zeros((len(cells), counts_array.shape[1]))
+    np.add.at(cell_counts, cell_ind, counts_array)
+    probabilities = (cell_counts + 0.5) / (cell_counts.sum(axis=1, keepdims=True) + 0.5 * counts_array.shape[1])
+
+    weight_matrix = np.stack(list(weights.values()), axis=1)
+    means = probabilities @ weight_matrix
+    stds = np.sqrt(np.maximum(probabilities @ weight_matrix ** 2 - means ** 2, 0))
+
+    if zne_extrapolation:
+        scale_ind = np.argmax(np.isclose(cells[:, 1][:, None], np.asarray(scale_factors)[None, :]), axis=1)
+        estimator = get_zne_estimator(scale_factors, method, order)
+        sensitivities = np.repeat(estimator[scale_ind][:, None], means.shape[1], axis=1)
+        if method == ZneMethods.EXPONENTIAL:
+            sensitivities = exponential_sensitivities(sensitivities, means, cells[:, 0], asymptote)
+    else:
+        sensitivities = np.ones_like(means)
+
+    # Lagrange optimum of sum(N) subject to sum(a^2 sigma^2 / N) = target^2 within every time step and observable
+    weighted_stds = np.abs(sensitivities) * stds
+    _, time_ind = np.unique(cells[:, 0], return_inverse=True)
+    time_totals = np.zeros((time_ind.max() + 1, weighted_stds.shape[1]))
+    np.add.at(time_totals, time_ind.ravel(), weighted_stds)
+    cell_shots = (weighted_stds * time_totals[time_ind.ravel()]).max(axis=1) / (target_error ** 2 * num_replicas)
+
+    shots = np.maximum(np.ceil(cell_shots[cell_ind]), pilot_shots)
+    shot_step = shot_step or int(pilot_shots.max())
+    shots = pilot_shots + np.ceil((shots - pilot_shots) / shot_step) * shot_step
+
+    return ShotAllocation(pilot_shots=pilot_shots.astype(int), shots=shots.astype(int), max_shots=max_shots)
+
+
+def exponential_sensitivities(estimator: np.ndarray, means: np.ndarray, times: np.ndarray,
+                              asymptote: float) -> np.ndarray:
+    """
+    Propagates the weights of the linear fit of log(value - asymptote) to the extrapolated value, where
+    d value_0 = value_0 sum(w_k d value_k / value_k) for the shifted values
+    """
+    shifted = np.where(means - asymptote > 0, means - asymptote, np.nan)
+    log_terms = estimator * np.log(shifted)
+    _, time_ind = np.unique(times, return_inverse=True)
+    log_zne = np.zeros((time_ind.max() + 1, means.shape[1]))
+    np.add.at(log_zne, time_ind.ravel(), log_terms)
+
+    return np.nan_to_num(estimator * np.exp(log_zne[time_ind.ravel()]) / shifted)
@@ -0,0 +1,135 @@
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+from qiskit.result import Result
+
+from src.analysis.analysis import PhysicalModel, ExperimentConfiguration, RunConfiguration, check_single_plaquette
+from src.analysis.constants import ZNE_ORDER
+from src.analysis.error_mitigation import get_counts_dataframe, get_exp_params
+from src.analysis.execution import BatchResult
+from src.analysis.utils import get_all_spin_up_state, get_gauss_base_state
+from src.observables.engine import counts_to_array
+
+
+class StreamingAnalyzer:
+    """
+    Analyzes the results of an experiment as they arrive, one job or batch at a time, keeping running means and
+    standard deviations over replicas for every (time, scale factor) cell
+    """
+
+    def __init__(self, physical_model: PhysicalModel, experiment_configuration: ExperimentConfiguration,
+                 run_configuration: RunConfiguration, result_key: Optional[str] = None,
+                 gauss_key: Optional[str] = None, mitigated_counts: dict = None, ignis: bool = True,
+                 meas_filter=None, observables: Optional[List[str]] = None):
+        check_single_plaquette(physical_model)
+        self.physical_model = physical_model
+        self.experiment_configuration = experiment_configuration
+        self.run_configuration = run_configuration
+        self.result_key = result_key or get_all_spin_up_state(physical_model.number_links)
+        self.gauss_key = gauss_key or get_gauss_base_state(physical_model.number_links)
+        self.mitigated_counts = mitigated_counts
+        self.ignis = ignis
+        self.meas_filter = meas_filter
+        self.observables = observables
+
+        self.zne_extrapolation = experiment_configuration.zne_extrapolation
+        self.keys = ['time', 'scale_factor'] if self.zne_extrapolation else ['time']
+        self._rows = list()
+        self._count = None
+        self._mean = None
+        self._m2 = None
+
+    def add_batch(self, batch: BatchResult) -> pd.DataFrame:
+        """
+        Adds a batch from run_circuits_async, whose experiments follow get_exp_params for its own time vector
+        """
+        experiments_params = get_exp_params(batch.time_vector, self.zne_extrapolation,
+                                            self.experiment_configuration.scale_factors,
+                                            self.experiment_configuration.num_replicas)
+        return self.add_result(batch.result, experiments_params)
+
+    def add_job(self, result: Result, experiment_offset: int) -> pd.DataFrame:
+        """
+        Adds the result of one job of run_circuits, holding consecutive experiments starting at experiment_offset
+        """
+        experiments_params = get_exp_params(self.run_configuration.time_vector, self.zne_extrapolation,
+                                            self.experiment_configuration.scale_factors,
+                                            self.experiment_configuration.num_replicas)
+        return self.add_result(result, experiments_params[experiment_offset:experiment_offset + len(result.results)])
+
+    def add_result(self, result: Result, experiments_params: np.ndarray) -> pd.DataFrame:
+        counts_list = [result.get_counts(exp_ind) for exp_ind in range(len(experiments_params))]
+        counts_array = counts_to_array(counts_list, len(self.result_key))
+        batch_df = get_counts_dataframe(counts_array, experiments_params, self.mitigated_counts, self.result_key,
+                                        self.gauss_key, self.zne_extrapolation, ignis=self.ignis,
+                                        shots=self.run_configuration.shots, meas_filter=self.meas_filter,
+                                        control_qubit=self.physical_model.control_qubit,
+                                        observables=self.observables)
+        self._rows.append(batch_df)
+        self._update_aggregates(batch_df)
+
+        return batch_df
+
+    def _update_aggregates(self, batch_df: pd.DataFrame):
+        # Running moments are merged with the parallel variance formula of Chan et al.
+        grouped = batch_df.drop(columns='replica').groupby(self.keys)
+        count = grouped.count()
+        mean = grouped.mean()
+        m2 = grouped.var(ddof=0) * count
+
+        if self._count is None:
+            self._count, self._mean, self._m2 = count, mean, m2
+            return
+
+        index = self._count.index.union(count.index)
+        count_a, mean_a, m2_a = (frame.reindex(index, fill_value=0) for frame in (self._count, self._mean, self._m2))
+        count_b, mean_b, m2_b = (frame.reindex(index, fill_value=0) for frame in (count, mean, m2))
+
+        self._count = count_a + count_b
+        delta = mean_b - mean_a
+        self._mean = mean_a + delta * count_b / self._count
+        self._m2 = m2_a + m2_b + delta ** 2 * count_a * count_b / self._count
+
+    @property
+    def results(self) -> pd.DataFrame:
+        """
+        Returns every experiment analyzed so far, with the same columns as analyze_results
+        """
+        if not self._rows:
+            return pd.DataFrame()
+
+        return pd.concat(self._rows, ignore_index=True).sort_values(self.keys + ['replica'], kind='stable')
+
+    def summary(self) -> pd.DataFrame:
+        """
+        Returns the mean, standard deviation over replicas and number of replicas of every (time, scale factor) cell
+        """
+        if self._count is None:
+            return pd.DataFrame()
+
+        std = np.sqrt(self._m2 / (self._count - 1).where(self._count > 1))
+        return pd.concat({'mean': self._mean, 'std': std, 'count': self._count}, axis=1).swaplevel(axis=1) \
+            .sort_index(axis=1).reset_index()
+
+    def zne(self, order: int = ZNE_ORDER) -> pd.DataFrame:
+        """
+        Returns the zero noise extrapolation of the replica means for the time steps where every scale factor has
+        been measured
+        """
+        scale_factors = list(self.experiment_configuration.scale_factors)
+        if not self.zne_extrapolation or self._mean is None:
+            return pd.DataFrame()
+
+        columns = self._mean.columns
+        means = self._mean.unstack('scale_factor').reindex(columns=pd.MultiIndex.from_product([columns, scale_factors]))
+        complete = means.notna().all(axis=1)
+        extrapolated = dict()
+        for column in columns:
+            values = means.loc[complete, column][scale_factors].to_numpy()
+            if len(values):
+                extrapolated[column] = np.polyfit(scale_factors, values.T, order)[-1]
+            else:
+                extrapolated[column] = np.array([])
+
+        return pd.DataFrame(extrapolated, index=means.index[complete]).reset_index()
@@ -0,0 +1,53 @@
+import hashlib
+import json
+from typing import List, Optional
+
+from qiskit import QuantumCircuit
+from qiskit.circuit import qpy_serialization
+
+from src.analysis.constants import TRANSPILATION_CACHE_SIZE
+from src.analysis.disk_cache import DiskCache
+
+
+class TranspilationCache(DiskCache):
+    """
+    On-disk cache of transpiled circuits stored as QPY files. The least recently used entries are evicted once the
+    directory grows beyond max_size bytes
+    """
+    extension = '.qpy'
+
+    def __init__(self, directory: str, max_size: int = TRANSPILATION_CACHE_SIZE):
+        super().__init__(directory, max_size)
+
+    @classmethod
+    def from_config(cls, experiment_config) -> Optional['TranspilationCache']:
+        """
+        Returns the cache of the directory of an ExperimentConfiguration, None when it does not enable caching
+        """
+        if not experiment_config.transpilation_cache:
+            return None
+
+        return cls(experiment_config.transpilation_cache)
+
+    @staticmethod
+    def get_key(circuit: QuantumCircuit, backend_name: str, basis_gates: List[str], coupling_map: Optional[list],
+                optimization_level: int, seed: Optional[int], calibration_date: Optional[str] = None,
+                layout: Optional[List[int]] = None) -> str:
+        key = {
+            'circuit': circuit.qasm(),
+            'backend': backend_name,
+            'basis_gates': list(basis_gates),
+            'coupling_map': [list(edge) for edge in coupling_map] if coupling_map else None,
+            'optimization_level': optimization_level,
+            'seed': seed,
+            'calibration_date': calibration_date,  # Noise aware layouts change when the device recalibrates
+            'layout': list(layout) if layout is not None else None,  # Layouts may reduce to the same coupling map
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+    def dump(self, circuit: QuantumCircuit, file):
+        qpy_serialization.dump(circuit, file)
+
+    def load(self, path: str) -> QuantumCircuit:
+        with open(path, 'rb') as file:
+            return qpy_serialization.load(file)[0]
@@ -1,9 +1,108 @@
-from mitiq.zne.scaling import fold_gates_at_random
+from typing import List, Optional
 
+import numpy as np
+import pandas as pd
 
-def custom_folding(circuit, scale_factor, seed=150):
-    folded = fold_gates_at_random(circuit,
-                                  scale_factor,
-                                  fidelities={'single': 1.0},
-                                  seed=seed)
-    return folded
+from src.analysis.constants import ZNE_ORDER, ZneMethods, FOLDING_SEED
+
+
+def custom_folding(circuit, scale_factor, seed=FOLDING_SEED):
+    from src.analysis.folding import fold_gates  # Needs qiskit, which the extrapolation does not
+
+    return fold_gates(circuit, [scale_factor], seed=seed)[0]
+
+
+def summarize_replicas(df_results: pd.DataFrame, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Returns the mean and standard deviation over replicas of every (time, scale factor) cell
+    """
+    keys = [key for key in ['time', 'scale_factor'] if key in df_results.columns]
+    if columns is None:
+        columns = [column for column in df_results.columns if column not in keys + ['replica']]
+
+    return df_results.groupby(keys)[columns].agg(['mean', 'std'])
+
+
+def extrapolate_zero_noise(df_results: pd.DataFrame, columns: Optional[List[str]] = None,
+                           method: str = ZneMethods.POLYNOMIAL, order: int = ZNE_ORDER,
+                           asymptote: float = 0.0) -> pd.DataFrame:
+    """
+    Returns a tidy table with the zero noise extrapolation of the replica means of every time and observable column.
+    All series are fitted in a single least squares solve sharing the Vandermonde matrix of the scale factors:
+    polynomial fits of the given order, Richardson extrapolation (interpolating polynomial) or exponential fits, done
+    as linear fits of log(value - asymptote).
+    The error column propagates the replica standard deviations through the fit, fit_error is estimated from the fit
+    residuals and is NaN when there are not more scale factors than fit parameters
+    """
+    summary = summarize_replicas(df_results, columns)
+    columns = list(summary.columns.get_level_values(0).unique())
+    scale_factors = np.sort(df_results.scale_factor.unique())
+
+    means = summary.xs('mean', axis=1, level=1).unstack('scale_factor').reindex(
+        columns=pd.MultiIndex.from_product([columns, scale_factors]))
+    stds = summary.xs('std', axis=1, level=1).unstack('scale_factor').reindex(
+        columns=pd.MultiIndex.from_product([columns, scale_factors]))
+    times = means.index.to_numpy()
+
+    # (scale factors x series) matrices, with series ordered by column first and time second
+    values = means.to_numpy().reshape(len(times), len(columns), len(scale_factors)).transpose(2, 1, 0) \
+        .reshape(len(scale_factors), -1)
+    errors = stds.to_numpy().reshape(len(times), len(columns), len(scale_factors)).transpose(2, 1, 0) \
+        .reshape(len(scale_factors), -1)
+
+    if method == ZneMethods.EXPONENTIAL:
+        shifted = values - asymptote
+        errors = errors / np.abs(np.where(shifted != 0, shifted, np.nan))
+        values = np.log(np.where(shifted > 0, shifted, np.nan))
+
+    vandermonde = get_vandermonde(scale_factors, method, order)
+    order = vandermonde.shape[1] - 1
+    coefficients, _, _, _ = np.linalg.lstsq(vandermonde, np.nan_to_num(values), rcond=None)
+    estimator = np.linalg.pinv(vandermonde)[0]  # Weights of each scale factor in the extrapolated value
+    zne = coefficients[0]
+    error = np.sqrt((estimator[:, None] ** 2 * errors ** 2).sum(axis=0))
+
+    degrees_of_freedom = len(scale_factors) - order - 1
+    if degrees_of_freedom > 0:
+        residuals = ((values - vandermonde @ coefficients) ** 2).sum(axis=0)
+        intercept_variance = np.linalg.inv(vandermonde.T @ vandermonde)[0, 0]
+        fit_error = np.sqrt(residuals / degrees_of_freedom * intercept_variance)
+    else:
+        fit_error = np.full(zne.shape, np.nan)
+
+    zne[np.isnan(values).any(axis=0)] = np.nan
+    if method == ZneMethods.EXPONENTIAL:
+        zne = np.exp(zne)
+        error, fit_error = error * zne, fit_error * zne
+        zne = zne + asymptote
+
+    return pd.DataFrame({
+        'time': np.tile(times, len(columns)),
+        'observable': np.repeat(columns, len(times)),
+        'value': zne,
+        'error': error,
+        'fit_error': fit_error,
+        'method': method,
+    })
+
+
+def get_vandermonde(scale_factors, method: str = ZneMethods.POLYNOMIAL, order: int = ZNE_ORDER) -> np.ndarray:
+    """
+    Returns the Vandermonde matrix of the linear fit behind every extrapolation method, exponential fits being linear
+    fits of the logarithm
+    """
+    if method == ZneMethods.RICHARDSON:
+        order = len(scale_factors) - 1
+    elif method == ZneMethods.EXPONENTIAL:
+        order = 1
+    elif method != ZneMethods.POLYNOMIAL:
+        raise ValueError(f'Unknown extrapolation method {method}')
+
+    return np.vander(np.asarray(scale_factors, dtype=float), order + 1, increasing=True)
+
+
+def get_zne_estimator(scale_factors, method: str = ZneMethods.POLYNOMIAL, order: int = ZNE_ORDER) -> np.ndarray:
+    """
+    Returns the weight of each scale factor in the extrapolated value of the linear fit
+    """
+    return np.linalg.pinv(get_vandermonde(scale_factors, method, order))[0]
@@ -2,8 +2,10 @@ import itertools
 
 import numpy as np
 from qiskit import QuantumCircuit, QuantumRegister, ClassicalRegister
+from qiskit.circuit import Parameter
 
-from src.models.constants import Groups
+from src.models.constants import Groups, Parameters, PLAQUETTE_TERMS
+from src.models.lattice import Lattice
 
 
 class Plaquette:
@@ -81,6 +83,14 @@ class SinglePlaquette(Plaquette):
         super().__init__(n_qubits, t, g)
         self.gauge_group = gauge_group
 
+    @classmethod
+    def with_time_parameter(cls, n_qubits: int, g: float = 1.0, gauge_group: str = Groups.Z2):
+        """
+        Returns a plaquette whose time is a symbolic parameter, so the generated circuit can be transpiled once and
+        bound to every value of a time vector afterwards
+        """
+        return cls(n_qubits, Parameter(Parameters.TIME), g, gauge_group=gauge_group)
+
     def __repr__(self):
         plaquette_type = 'square' if self.n_qubits == 5 else 'triangle'
         return str(
@@ -213,3 +223,77 @@ class SinglePlaquette(Plaquette):
         self.backward_entangle(qs_real, q_control)
         self.apply_h_gate(qs_real)
         self.circuit.u2(-np.pi / 2, -np.pi / 2, self.q_register[q_control])
+
+
+class LatticePlaquettes(Plaquette):
+    """
+    Trotterized evolution of a lattice of plaquettes sharing links. Plaquettes that do not share links are evolved in
+    the same layer, each one with its own control qubit placed after the link qubits
+    """
+
+    def __init__(self, lattice: Lattice, t: float = 1.0, g: float = 1.0, gauge_group: str = Groups.Z2,
+                 trotter_steps: int = 1):
+        self.lattice = lattice
+        self.layers = lattice.get_layers()
+        self.gauge_group = gauge_group
+        self.trotter_steps = trotter_steps
+        super().__init__(lattice.number_links + max(len(layer) for layer in self.layers), t, g)
+
+    @classmethod
+    def with_time_parameter(cls, lattice: Lattice, g: float = 1.0, gauge_group: str = Groups.Z2,
+                            trotter_steps: int = 1):
+        return cls(lattice, Parameter(Parameters.TIME), g, gauge_group=gauge_group, trotter_steps=trotter_steps)
+
+    def __repr__(self):
+        return str(
+            f'Lattice of plaquettes with params: \n'
+            f'n_qubits: {self.n_qubits}, \n'
+            f'plaquettes: {len(self.lattice.plaquettes)}, \n'
+            f'layers: {len(self.layers)}, \n'
+            f't: {self.t}, \n'
+            f'g: {self.g}, \n'
+            f'group: {self.gauge_group}, \n'
+            f'trotter steps: {self.trotter_steps}')
+
+    def plaquette_term(self, links: list, link_paulis: str, q_control: int, time_factor: float):
+        x_links = [q_ind for q_ind, pauli in zip(links, link_paulis) if pauli == 'X']
+        y_links = [q_ind for q_ind, pauli in zip(links, link_paulis) if pauli == 'Y']
+
+        # The control qubit is rotated into the basis used by the single plaquette of the same size
+        if len(links) % 2:
+            self.circuit.u2(np.pi / 2, np.pi / 2, self.q_register[q_control])
+        else:
+            self.circuit.h(self.q_register[q_control])
+        self.x_back_rotate(x_links)
+        self.y_back_rotate(y_links)
+
+        self.forward_entangle(links, q_control)
+        self.time_evolution(q_control, time_factor=time_factor)
+        self.backward_entangle(links, q_control)
+
+        self.y_rotate(y_links)
+        self.x_rotate(x_links)
+        if len(links) % 2:
+            self.circuit.u2(np.pi / 2, np.pi / 2, self.q_register[q_control])
+        else:
+            self.circuit.h(self.q_register[q_control])
+
+    def generate_circuit(self):
+        for _ in range(self.trotter_steps):
+            for layer in self.layers:
+                plaquettes = [list(self.lattice.plaquettes[plaquette_ind]) for plaquette_ind in layer]
+                for plaquette in plaquettes:
+                    if (self.gauge_group, len(plaquette)) not in PLAQUETTE_TERMS:
+                        raise ValueError("Plaquettes can only have 3 or 4 links")
+
+                for control_ind, plaquette in enumerate(plaquettes):
+                    q_control = self.lattice.number_links + control_ind
+                    for link_paulis, _, coefficient in PLAQUETTE_TERMS[(self.gauge_group, len(plaquette))]:
+                        self.plaquette_term(plaquette, link_paulis, q_control, coefficient / self.trotter_steps)
+
+        c_register = ClassicalRegister(self.n_qubits, 'c')
+        meas = QuantumCircuit(self.q_register, c_register)
+        meas.barrier(self.q_register)
+        meas.measure(self.q_register, c_register)
+
+        return self.circuit + meas
@@ -1,3 +1,21 @@
+from typing import Dict, List, Tuple
+
+
 class Groups:
     Z2 = 'z2'
     U1 = 'u1'
+
+
+class Parameters:
+    TIME = 't'
+
+
+# Pauli terms generated by the SinglePlaquette circuits, as (link paulis, control pauli, coefficient). Link paulis are
+# ordered by increasing qubit index, the control qubit stays in an eigenstate of its pauli during the evolution
+PLAQUETTE_TERMS: Dict[Tuple[str, int], List[Tuple[str, str, float]]] = {
+    (Groups.Z2, 3): [('XXX', 'Y', 1.0)],
+    (Groups.Z2, 4): [('XXXX', 'Z', 1.0)],
+    (Groups.U1, 3): [('XXX', 'Y', 1.0), ('YYX', 'Y', -1.0), ('YXY', 'Y', -1.0), ('XYY', 'Y', -1.0)],
+    (Groups.U1, 4): [(links, 'Z', 1.0) for links in
+                     ['XXXX', 'YYXX', 'YXYX', 'XYYX', 'YXXY', 'XYXY', 'XXYY', 'YYYY']],
+}
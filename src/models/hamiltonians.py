@@ -0,0 +1,64 @@
+from typing import Dict
+
+import numpy as np
+from scipy import sparse
+
+from src.models.constants import PLAQUETTE_TERMS
+from src.models.lattice import Lattice
+
+
+def pauli_string_sparse(paulis: Dict[int, str], n_qubits: int) -> sparse.csr_matrix:
+    """
+    Returns the sparse matrix of a product of paulis acting on the given qubits, qubit 0 being the least significant.
+    Every basis state j is sent to j with the X and Y qubits flipped, with a phase from the Y and Z qubits
+    """
+    states = np.arange(2 ** n_qubits)
+    flip_mask = sum(1 << q_ind for q_ind, pauli in paulis.items() if pauli in 'XY')
+    parity = np.zeros(2 ** n_qubits, dtype=int)
+    for q_ind, pauli in paulis.items():
+        if pauli in 'YZ':
+            parity ^= (states >> q_ind) & 1
+
+    number_y = sum(pauli == 'Y' for pauli in paulis.values())
+    phases = 1j ** number_y * (1 - 2 * parity)
+
+    return sparse.csr_matrix((phases, (states ^ flip_mask, states)), shape=(2 ** n_qubits, 2 ** n_qubits))
+
+
+def pauli_string_matrix(paulis: Dict[int, str], n_qubits: int) -> np.ndarray:
+    return pauli_string_sparse(paulis, n_qubits).toarray()
+
+
+def plaquette_hamiltonian(gauge_group: str, number_links: int, g: float = 1.0, control_qubit: int = 1) -> np.ndarray:
+    """
+    Returns the Hamiltonian over the links and control qubit whose evolution the SinglePlaquette circuits implement,
+    up to the basis changes of the triangle plaquettes
+    """
+    if (gauge_group, number_links) not in PLAQUETTE_TERMS:
+        raise ValueError("Number of links can only be 3 or 4")
+
+    n_qubits = number_links + 1
+    link_qubits = [q_ind for q_ind in range(n_qubits) if q_ind != control_qubit]
+    hamiltonian = np.zeros((2 ** n_qubits, 2 ** n_qubits), dtype=complex)
+    for link_paulis, control_pauli, coefficient in PLAQUETTE_TERMS[(gauge_group, number_links)]:
+        paulis = dict(zip(link_qubits, link_paulis))
+        paulis[control_qubit] = control_pauli
+        hamiltonian += g * coefficient * pauli_string_matrix(paulis, n_qubits)
+
+    return hamiltonian
+
+
+def lattice_hamiltonian(lattice: Lattice, gauge_group: str, g: float = 1.0) -> sparse.csr_matrix:
+    """
+    Returns the sparse Hamiltonian over the links of a lattice, summing the plaquette terms of every plaquette
+    """
+    hamiltonian = sparse.csr_matrix((2 ** lattice.number_links, 2 ** lattice.number_links), dtype=complex)
+    for plaquette in lattice.plaquettes:
+        if (gauge_group, len(plaquette)) not in PLAQUETTE_TERMS:
+            raise ValueError("Plaquettes can only have 3 or 4 links")
+
+        for link_paulis, _, coefficient in PLAQUETTE_TERMS[(gauge_group, len(plaquette))]:
+            paulis = dict(zip(plaquette, link_paulis))
+            hamiltonian = hamiltonian + g * coefficient * pauli_string_sparse(paulis, lattice.number_links)
+
+    return hamiltonian
@@ -0,0 +1,54 @@
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+
+@dataclass
+class Lattice:
+    """
+    Plaquettes sharing links, each plaquette given by the indices of its links in cyclic order
+    """
+    number_links: int
+    plaquettes: List[Tuple[int, ...]] = field(default_factory=list)
+
+    def get_layers(self) -> List[List[int]]:
+        """
+        Returns the plaquette indices grouped in layers of plaquettes that do not share any link, so each layer can
+        be evolved in parallel
+        """
+        layers = list()
+        layer_links = list()
+        for plaquette_ind, plaquette in enumerate(self.plaquettes):
+            for layer, links in zip(layers, layer_links):
+                if links.isdisjoint(plaquette):
+                    layer.append(plaquette_ind)
+                    links.update(plaquette)
+                    break
+            else:
+                layers.append([plaquette_ind])
+                layer_links.append(set(plaquette))
+
+        return layers
+
+
+def square_lattice(rows: int, columns: int) -> Lattice:
+    """
+    Returns a lattice of rows x columns square plaquettes with open boundaries. Horizontal links come first, numbered
+    row by row, followed by the vertical links
+    """
+    horizontal_links = (rows + 1) * columns
+
+    def horizontal(row: int, column: int) -> int:
+        return row * columns + column
+
+    def vertical(row: int, column: int) -> int:
+        return horizontal_links + row * (columns + 1) + column
+
+    plaquettes = [(horizontal(row, column), vertical(row, column + 1), horizontal(row + 1, column),
+                   vertical(row, column))
+                  for row in range(rows) for column in range(columns)]
+
+    return Lattice(horizontal_links + rows * (columns + 1), plaquettes)
+
+
+def ladder(number_plaquettes: int) -> Lattice:
+    return square_lattice(1, number_plaquettes)
@@ -0,0 +1,158 @@
+from typing import Dict, Optional
+
+import numpy as np
+from qiskit import QuantumCircuit
+from qiskit.circuit import Gate, ParameterExpression
+from qiskit.circuit.exceptions import CircuitError
+from qiskit.circuit.library import SGate, SdgGate, ZGate, TGate, TdgGate, U1Gate
+
+# Phase gates diag(1, exp(i * angle)), the rotations the plaquette circuits use around the controlled-Z entanglers
+PHASE_GATES = {'s': np.pi / 2, 'sdg': -np.pi / 2, 'z': np.pi, 't': np.pi / 4, 'tdg': -np.pi / 4}
+NAMED_PHASES = [(np.pi / 2, SGate), (-np.pi / 2, SdgGate), (np.pi, ZGate), (np.pi / 4, TGate), (-np.pi / 4, TdgGate)]
+DIAGONAL_GATES = {'cz', 'cu1', 'cp', 'crz', 'rz', 'rzz', 'u1', 'p', *PHASE_GATES}
+SELF_INVERSE_GATES = {'cz', 'cx', 'cy', 'swap'}
+SYMMETRIC_GATES = {'cz', 'swap'}
+ATOL = 1e-10
+
+
+def optimize_plaquette_circuit(circuit: QuantumCircuit) -> QuantumCircuit:
+    """
+    Cancels and merges the redundant gates of the generated plaquette circuits. Each plaquette term is a basis change
+    of the links, a ladder of controlled-Z gates dressed with S gates and the rotation of the control qubit, so
+    consecutive terms leave inverse pairs that are only adjacent once the diagonal gates are commuted past each other.
+    Gates are pushed in order and each one is cancelled or merged with the latest gate on its qubits it does not
+    commute with, which unwinds the entangle blocks of consecutive terms one pair at a time
+    """
+    operations = list()
+    qubit_operations = dict()
+    global_phase = 0
+
+    for instruction, qargs, cargs in circuit.data:
+        partner = find_partner(operations, qubit_operations, instruction, qargs, cargs)
+        if partner is None:
+            operations.append((instruction, qargs, cargs))
+            for qubit in qargs:
+                qubit_operations.setdefault(qubit, list()).append(len(operations) - 1)
+            continue
+
+        merged, phase = combine(operations[partner][0], instruction)
+        global_phase += phase
+        if merged is None:
+            operations[partner] = None
+            for qubit in qargs:
+                qubit_operations[qubit].remove(partner)
+        else:
+            operations[partner] = (merged, *operations[partner][1:])
+
+    optimized = circuit.copy()
+    optimized.data = [operation for operation in operations if operation is not None]
+    optimized.global_phase = circuit.global_phase + global_phase
+
+    return optimized
+
+
+def find_partner(operations: list, qubit_operations: Dict, instruction, qargs: list, cargs: list) -> Optional[int]:
+    """
+    Returns the index of the operation the instruction cancels or merges with, walking back over the operations it
+    commutes with. None when the instruction has to be kept
+    """
+    if not is_plain_gate(instruction, cargs):
+        return None
+
+    first_qubit, *other_qubits = qargs
+    for index in reversed(qubit_operations.get(first_qubit, [])):
+        operation, operation_qargs, operation_cargs = operations[index]
+        if is_plain_gate(operation, operation_cargs) and is_partner(operation, operation_qargs, instruction, qargs):
+            later_operations = [operations[other_index] for qubit in other_qubits
+                                for other_index in qubit_operations.get(qubit, []) if other_index > index]
+            if all(commute(later[0], instruction) for later in later_operations):
+                return index
+
+        if not commute(operation, instruction):
+            return None
+
+    return None
+
+
+def is_plain_gate(instruction, cargs: list) -> bool:
+    return isinstance(instruction, Gate) and not cargs and instruction.condition is None
+
+
+def is_diagonal(instruction) -> bool:
+    return instruction.name in DIAGONAL_GATES
+
+
+def commute(first, second) -> bool:
+    # Only diagonal gates are commuted, any other pair acting on a common qubit blocks the search
+    return is_diagonal(first) and is_diagonal(second) and first.condition is None and second.condition is None
+
+
+def is_partner(operation, operation_qargs: list, instruction, qargs: list) -> bool:
+    if len(qargs) == 1:
+        if operation_qargs != qargs:
+            return False
+        if phase_angle(operation) is not None and phase_angle(instruction) is not None:
+            return True
+        return is_identity(single_qubit_product(operation, instruction))
+
+    if operation.name != instruction.name or instruction.name not in SELF_INVERSE_GATES:
+        return False
+    if instruction.name in SYMMETRIC_GATES:
+        return set(operation_qargs) == set(qargs)
+
+    return list(operation_qargs) == list(qargs)
+
+
+def combine(operation, instruction) -> (Optional[Gate], float):
+    """
+    Returns the gate replacing the pair, None when the pair is the identity, and the global phase it leaves
+    """
+    if instruction.num_qubits > 1:
+        return None, 0
+
+    operation_angle = phase_angle(operation)
+    instruction_angle = phase_angle(instruction)
+    if operation_angle is not None and instruction_angle is not None:
+        return phase_gate(operation_angle + instruction_angle), 0
+
+    product = single_qubit_product(operation, instruction)
+    return None, float(np.angle(product[0, 0]))
+
+
+def phase_angle(instruction):
+    if instruction.name in PHASE_GATES:
+        return PHASE_GATES[instruction.name]
+    if instruction.name in ('u1', 'p'):
+        return instruction.params[0]
+
+    return None
+
+
+def phase_gate(angle) -> Optional[Gate]:
+    if isinstance(angle, ParameterExpression) and angle.parameters:
+        return U1Gate(angle)
+
+    angle = np.pi - (np.pi - float(angle)) % (2 * np.pi)  # In (-pi, pi]
+    if np.isclose(angle, 0, atol=ATOL):
+        return None
+    for named_angle, gate in NAMED_PHASES:
+        if np.isclose(angle, named_angle, atol=ATOL):
+            return gate()
+
+    return U1Gate(angle)
+
+
+def single_qubit_product(operation, instruction) -> Optional[np.ndarray]:
+    try:
+        return instruction.to_matrix() @ operation.to_matrix()
+    except (CircuitError, TypeError):
+        return None
+
+
+def is_identity(matrix: Optional[np.ndarray]) -> bool:
+    if matrix is None:
+        return False
+
+    return np.allclose(matrix, matrix[0, 0] * np.eye(len(matrix)), atol=ATOL) and \
+        np.isclose(abs(matrix[0, 0]), 1, atol=ATOL)
+
@@ -0,0 +1,48 @@
+from typing import Dict, List, Union
+
+import numpy as np
+
+
+def counts_to_array(counts_list: List[dict], n_qubits: int) -> np.ndarray:
+    """
+    Returns a dense (experiments x 2^n_qubits) array with the counts of every experiment, indexed by the integer value
+    of the bitstring
+    """
+    counts_array = np.zeros((len(counts_list), 2 ** n_qubits))
+    for exp_ind, counts in enumerate(counts_list):
+        if not counts:
+            continue
+        states = [state_index(state) for state in counts.keys()]
+        counts_array[exp_ind, states] = list(counts.values())
+
+    return counts_array
+
+
+def state_index(state: str) -> int:
+    return int(state.replace(' ', ''), 2)
+
+
+def counts_qubits(counts: dict) -> int:
+    return len(next(iter(counts)).replace(' ', '')) if counts else 0
+
+
+def qubit_values(n_qubits: int) -> np.ndarray:
+    """
+    Returns a (2^n_qubits x n_qubits) array where column i holds the value of qubit i in every basis state, following
+    the qiskit convention of qubit 0 being the rightmost bit
+    """
+    states = np.arange(2 ** n_qubits)
+    return (states[:, None] >> np.arange(n_qubits)[None, :]) & 1
+
+
+def evaluate_observables(counts_array: np.ndarray, weights: Dict[str, np.ndarray],
+                         shots: Union[int, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    Evaluates every observable for every experiment as a single matrix product against the stacked weight vectors.
+    Shots can be given per experiment
+    """
+    names = list(weights.keys())
+    weight_matrix = np.stack([weights[name] for name in names], axis=1)
+    values = counts_array @ weight_matrix / np.reshape(shots, (-1, 1))
+
+    return {name: values[:, ind] for ind, name in enumerate(names)}
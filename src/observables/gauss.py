@@ -1,19 +1,54 @@
-def gauss_law(counts: dict, mitigated_counts: dict, shots: int):
-    obs = 0.0
-    obs_corrected = 0.0
-    links = [0, 0, 0, 0, 0]
-    for links[0] in range(2):
-        for links[1] in range(2):
-            for links[2] in range(2):
-                for links[3] in range(2):
-                    for links[4] in range(2):
-                        s = ''
-                        s += str(links[0]) + str(links[1]) + str(links[2]) + str(links[3]) + str(links[4])
-                        add_links = (2 * links[0] - 1) * (2 * links[1] - 1)
-                        add_corrected = add_links * mitigated_counts.get(s, 0) / shots
-                        obs_corrected += add_corrected
-                        add = add_links * counts.get(s, 0) / shots
-                        obs += add
+import numpy as np
+
+from src.observables.engine import counts_qubits, counts_to_array, state_index
+from src.observables.registry import compile_observable, register_observable
+
+GAUSS_LAW = 'gauss_law'
+SECTOR_2 = 'sector_2'
+GAUSS_LAW_SQUARED = 'gauss_law_squared'
+
+DEFAULT_CONTROL_QUBIT = 1
+
+
+@register_observable(GAUSS_LAW)
+def gauss_law_links(links: np.ndarray, control: np.ndarray) -> np.ndarray:
+    return (2 * links[:, -1] - 1) * (2 * links[:, -2] - 1)
+
+
+@register_observable(GAUSS_LAW_SQUARED)
+def gauss_law_squared_links(links: np.ndarray, control: np.ndarray) -> np.ndarray:
+    return ((links - np.roll(links, -1, axis=1)) ** 2).sum(axis=1)
+
+
+def gauss_law_weights(n_qubits: int, control_qubit: int = DEFAULT_CONTROL_QUBIT) -> np.ndarray:
+    return compile_observable(GAUSS_LAW, n_qubits, control_qubit)
+
+
+def gauss_law_squared_weights(n_qubits: int, control_qubit: int = DEFAULT_CONTROL_QUBIT) -> np.ndarray:
+    return compile_observable(GAUSS_LAW_SQUARED, n_qubits, control_qubit)
+
+
+def state_weights(state: str) -> np.ndarray:
+    weights = np.zeros(2 ** len(state.replace(' ', '')))
+    weights[state_index(state)] = 1.0
+
+    return weights
+
+
+def get_observable_weights(names: list, n_qubits: int, control_qubit: int, gauss_key: str) -> dict:
+    """
+    Returns the weight vectors of the requested observables, where sector_2 is the projector on gauss_key
+    """
+    return {name: state_weights(gauss_key) if name == SECTOR_2 else compile_observable(name, n_qubits, control_qubit)
+            for name in names}
+
+
+def gauss_law(counts: dict, mitigated_counts: dict, shots: int, control_qubit: int = DEFAULT_CONTROL_QUBIT):
+    n_qubits = counts_qubits(counts) or counts_qubits(mitigated_counts)
+    if n_qubits == 0:  # No counts at all
+        return 0.0, 0.0
+    counts_array = counts_to_array([counts, mitigated_counts], n_qubits)
+    obs, obs_corrected = counts_array @ gauss_law_weights(n_qubits, control_qubit) / shots
 
     return obs, obs_corrected
 
@@ -25,24 +60,11 @@ def sector_2(gauss_key: str, counts: dict, mitigated_counts: dict, shots: int):
     return sector_2_obs, sector_2_obs_corrected
 
 
-def gauss_law_squared(counts: dict, mitigated_counts: dict, shots: int):
-    wind = 0.0
-    wind_corrected = 0.0
-    links = [0, 0, 0, 0, 0]
-    for links[0] in range(2):
-        for links[1] in range(2):
-            for links[2] in range(2):
-                for links[3] in range(2):
-                    for links[4] in range(2):
-                        s = ''
-                        s += str(links[4]) + str(links[3]) + str(links[2]) + str(links[1]) + str(links[0])
-                        add_links = (((links[0] - .5) - (links[2] - .5)) ** 2)
-                        add_links += (((links[2] - .5) - (links[3] - .5)) ** 2)
-                        add_links += (((links[3] - .5) - (links[4] - .5)) ** 2)
-                        add_links += (((links[4] - .5) - (links[0] - .5)) ** 2)
-                        add_corrected = add_links * mitigated_counts.get(s, 0) / shots
-                        wind_corrected += add_corrected
-                        add = add_links * counts.get(s, 0) / shots
-                        wind += add
+def gauss_law_squared(counts: dict, mitigated_counts: dict, shots: int, control_qubit: int = DEFAULT_CONTROL_QUBIT):
+    n_qubits = counts_qubits(counts) or counts_qubits(mitigated_counts)
+    if n_qubits == 0:  # No counts at all
+        return 0.0, 0.0
+    counts_array = counts_to_array([counts, mitigated_counts], n_qubits)
+    wind, wind_corrected = counts_array @ gauss_law_squared_weights(n_qubits, control_qubit) / shots
 
     return wind, wind_corrected
@@ -0,0 +1,49 @@
+from functools import lru_cache
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from src.observables.engine import qubit_values
+
+ObservableFunction = Callable[[np.ndarray, np.ndarray], np.ndarray]
+
+OBSERVABLES: Dict[str, ObservableFunction] = dict()
+
+
+def register_observable(name: str):
+    """
+    Registers a function of the link and control bits as an observable. The function receives a (2^n x n_links) array
+    with the value of every link in each basis state, links ordered by increasing qubit index, and the array with the
+    value of the control qubit, and returns the value of the observable in each basis state
+    """
+
+    def decorator(function: ObservableFunction) -> ObservableFunction:
+        OBSERVABLES[name] = function
+        compile_observable.cache_clear()
+        return function
+
+    return decorator
+
+
+def get_link_qubits(n_qubits: int, control_qubit: int) -> Tuple[int, ...]:
+    return tuple(q_ind for q_ind in range(n_qubits) if q_ind != control_qubit)
+
+
+@lru_cache(maxsize=None)
+def compile_observable(name: str, n_qubits: int, control_qubit: int,
+                       link_qubits: Optional[Tuple[int, ...]] = None) -> np.ndarray:
+    """
+    Returns the weight vector of a registered observable over the 2^n_qubits basis states
+    """
+    if name not in OBSERVABLES:
+        raise ValueError(f'Observable {name} is not registered')
+
+    if link_qubits is None:
+        link_qubits = get_link_qubits(n_qubits, control_qubit)
+
+    qubits = qubit_values(n_qubits)
+    weights = np.asarray(OBSERVABLES[name](qubits[:, list(link_qubits)], qubits[:, control_qubit]), dtype=float)
+    weights = np.broadcast_to(weights, (2 ** n_qubits,)).copy()
+    weights.setflags(write=False)
+
+    return weights